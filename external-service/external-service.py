@@ -449,10 +449,11 @@ async def _process_lecture_complete(
             # Step 2: Transcribe audio via main backend (which calls RunPod)
             logger.info(f"[Lecture {lecture_id}] Step 2: Transcribing audio")
 
+            # Send the audio as raw bytes (base64 JSON is 33% larger and must be decoded again)
             transcribe_response = await client.post(
                 f"{backend_url}/api/internal/transcribe-audio",
-                json={"audio_data": audio_base64, "language": "he"},
-                headers=headers
+                content=base64.b64decode(audio_base64),
+                headers={**headers, "Content-Type": "audio/mpeg"}
             )
             transcribe_response.raise_for_status()
             transcription_result = transcribe_response.json()
@@ -537,7 +538,7 @@ async def process_lecture_complete(
     - lecture_id: ID of the lecture being processed
     - video_file: Uploaded video file (multipart)
     - video_url: OR video URL (form data)
-    - slides_data: JSON string of slides data [{"index": 0, "image_data": "..."}, ...]
+    - slides_data: JSON string of slide indices [{"index": 0}, {"index": 1}, ...]
     - backend_url: Main backend URL to send results back to
     - api_key: Optional API key for backend authentication
     """
@@ -1,37 +1,115 @@
 # app/api/background_tasks.py
 import os
+import asyncio
 import logging
-from typing import Optional, Callable
-from sqlalchemy.orm import Session
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Callable
 
-from app.db.models import Slide, TranscriptionSegment
-from app.services.transcription import TranscriptionService
+import httpx
+import orjson
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+from app.db.connection import AsyncSessionLocal
+from app.db.models import Slide
+from app.services.presentation import PresentationService
+from app.services.registry import get_transcription_service
 from app.services.slide_matching import SlideMatchingService
-from app.utils.database import update_lecture_status
+from app.utils.database import update_lecture_status_async, upsert_transcription_segments_async, bulk_insert_rows_async
+from app.utils.images import split_data_url
+from app.utils.ocr import OCR_AVAILABLE, extract_text_from_image_bytes_async
 
 logger = logging.getLogger(__name__)
 
 # Initialize services
-transcription_service = TranscriptionService()
+presentation_service = PresentationService()
 slide_matching_service = SlideMatchingService()
 
+# Worker processes for local video processing (created on first use)
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # "spawn" so workers build their own engines/clients instead of inheriting the parent's
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.BACKGROUND_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Started video processing pool with {max(1, settings.BACKGROUND_WORKERS)} worker(s)")
+    return _process_pool
+
+
+def run_video_processing_job(video_path_or_url: str, lecture_id: int) -> None:
+    """Worker process entry point: runs the pipeline on the worker's own event loop and DB sessions."""
+    from app.db.connection import AsyncSessionLocal, async_engine
+
+    async def run_job():
+        try:
+            await process_video_background(video_path_or_url, lecture_id, AsyncSessionLocal)
+        finally:
+            # Pooled connections belong to this job's event loop; the next job gets a new loop.
+            # That goes for the shared TranscriptionService's httpx client too, so close it and
+            # let the next job build a fresh one.
+            await async_engine.dispose()
+            await get_transcription_service().close_client()
+            get_transcription_service.cache_clear()
+
+    asyncio.run(run_job())
+
+
+def submit_video_processing(video_path_or_url: str, lecture_id: int) -> asyncio.Future:
+    """Schedules process_video_background in the worker pool without blocking the API event loop."""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_process_pool(), run_video_processing_job, video_path_or_url, lecture_id)
+
+    def _log_result(done: asyncio.Future):
+        if not done.cancelled() and done.exception():
+            logger.error(f"[BG Task {lecture_id}] Worker process crashed: {done.exception()}")
+
+    future.add_done_callback(_log_result)
+    return future
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+# Shared client for the external service, so dispatches reuse a warm connection to Cloud Run
+_external_http = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=20),
+)
+
+
+async def close_external_http_client() -> None:
+    """Closes the shared external-service client. Called on application shutdown."""
+    await _external_http.aclose()
 
 async def process_video_background(
     video_path_or_url: str,
     lecture_id: int,
-    db_session_factory: Callable[[], Session]
+    db_session_factory: Callable[[], AsyncSession]
 ):
     """Background task: audio extraction, transcription, slide matching, saving."""
     audio_path: Optional[str] = None
     video_file_to_delete: Optional[str] = video_path_or_url if not video_path_or_url.startswith(('http://', 'https://')) else None
-    db: Optional[Session] = None
+    db: Optional[AsyncSession] = None
+    transcription_service = get_transcription_service()
 
-    def update_status(status: str):
+    async def update_status(status: str):
         """Nested helper to update status using the task's DB session."""
         if not db:
             return
         try:
-            update_lecture_status(db, lecture_id, status)
+            await update_lecture_status_async(db, lecture_id, status)
         except Exception as e:
             logger.error(f"[BG Task Helper] Status update failed for L:{lecture_id} S:{status}: {e}")
 
@@ -40,7 +118,7 @@ async def process_video_background(
         logger.info(f"[BG Task {lecture_id}] Started.")
 
         # 1. Audio Handling
-        update_status("downloading")
+        await update_status("downloading")
         if video_file_to_delete:
             logger.info(f"[BG Task {lecture_id}] Processing local video file: {video_path_or_url}")
             if not os.path.exists(video_path_or_url):
@@ -57,19 +135,27 @@ async def process_video_background(
         logger.info(f"[BG Task {lecture_id}] Audio ready: {audio_path} (size: {os.path.getsize(audio_path)} bytes)")
 
         # 2. Transcription
-        update_status("transcribing")
+        await update_status("transcribing")
         transcription_result = await transcription_service.transcribe(audio_path)
         if not transcription_result or 'segments' not in transcription_result:
             raise ValueError("Invalid transcription result format.")
         transcription_segments_raw = transcription_result['segments']
         logger.info(f"[BG Task {lecture_id}] Transcription found {len(transcription_segments_raw)} segments.")
+        if not transcription_segments_raw:
+            # Fail rather than complete with an empty transcript the user can't tell from success
+            raise ValueError("Transcription found no speech in the audio.")
 
         # 3. Slide Matching
-        update_status("matching")
-        slides = db.query(Slide).filter(Slide.lecture_id == lecture_id).order_by(Slide.index).all()
-        if not slides:
+        await update_status("matching")
+        result = await db.execute(
+            select(Slide.image_data, Slide.image_mime, Slide.index).filter(Slide.lecture_id == lecture_id).order_by(Slide.index)
+        )
+        slides_data = [
+            {'image_data': image_data, 'image_mime': image_mime, 'index': index}
+            for image_data, image_mime, index in result.all()
+        ]
+        if not slides_data:
             raise ValueError(f"No slides found in DB for lecture {lecture_id}.")
-        slides_data = [{'image_data': s.image_data, 'index': s.index} for s in slides]
         transcription_data = [
             {'start_time': seg['start_time'], 'end_time': seg['end_time'], 'text': seg['text'], 'confidence': seg.get('confidence', 1.0)}
             for seg in transcription_segments_raw if seg.get('start_time') is not None
@@ -80,41 +166,34 @@ async def process_video_background(
         logger.info(f"[BG Task {lecture_id}] Matching complete ({len(matched_segments_data)} segments).")
 
         # 4. Save Segments
-        update_status("saving_segments")
-        db.query(TranscriptionSegment).filter(TranscriptionSegment.lecture_id == lecture_id).delete()
-        db.flush()
-        segments_to_add = [
-            TranscriptionSegment(
-                lecture_id=lecture_id, start_time=seg['start_time'], end_time=seg['end_time'],
-                text=seg.get('text', ''), confidence=seg.get('confidence', 1.0), slide_index=seg['slide_index']
-            ) for seg in matched_segments_data if seg.get('slide_index') is not None
-        ]
-        if segments_to_add:
-            db.add_all(segments_to_add)
-            logger.info(f"[BG Task {lecture_id}] Saving {len(segments_to_add)} segments.")
+        await update_status("saving_segments")
+        valid_segments = [seg for seg in matched_segments_data if seg.get('slide_index') is not None]
+        saved_count = await upsert_transcription_segments_async(db, lecture_id, valid_segments)
+        if saved_count:
+            logger.info(f"[BG Task {lecture_id}] Saved {saved_count} segments.")
         else:
             logger.warning(f"[BG Task {lecture_id}] No valid segments to save after matching.")
-        db.commit()
 
-        # 5. Mark Complete
-        update_status("completed")
+        # 5. Mark Complete (commits the segments and the status together)
+        if not await update_lecture_status_async(db, lecture_id, "completed"):
+            raise RuntimeError("Failed to mark lecture completed.")
         logger.info(f"[BG Task {lecture_id}] Completed successfully.")
 
     except (FileNotFoundError, ValueError) as specific_err:
         logger.error(f"[BG Task {lecture_id}] Failed: {specific_err}", exc_info=True)
         if db:
-            update_status("failed")
+            await update_status("failed")
     except Exception as e:
         logger.error(f"[BG Task {lecture_id}] Unexpected error: {e}", exc_info=True)
         if db:
             try:
-                update_status("failed")
+                await db.rollback()
             except Exception:
-                logger.error(f"[BG Task {lecture_id}] Also failed to mark as failed.")
+                logger.error(f"[BG Task {lecture_id}] Rollback failed during error handling.")
             try:
-                db.rollback()
+                await update_status("failed")
             except Exception:
-                logger.error(f"[BG Task {lecture_id}] Rollback failed during error handling.")
+                logger.error(f"[BG Task {lecture_id}] Also failed to mark as failed.")
     finally:
         # 6. Cleanup
         logger.info(f"[BG Task {lecture_id}] Cleaning up resources.")
@@ -129,4 +208,144 @@ async def process_video_background(
             except Exception as cl_err:
                 logger.error(f"[BG Task {lecture_id}] Video cleanup error: {cl_err}")
         if db:
-            db.close()
\ No newline at end of file
+            await db.close()
+
+
+async def _dispatch_external_processing(
+    lecture_id: int,
+    slides_list: List[Dict[str, Any]],
+    video_path_or_url: str,
+    video_filename: Optional[str]
+):
+    """Hands a lecture (slides + video file or URL) to the external Cloud Run service."""
+    # Get backend URL from settings
+    backend_url = settings.BACKEND_URL or "https://notelecture-backend.vercel.app"
+
+    # Prepare data for multipart form
+    data = {
+        "lecture_id": str(lecture_id),
+        "slides_data": orjson.dumps(slides_list).decode(),
+        "backend_url": backend_url,
+        "api_key": settings.EXTERNAL_SERVICE_API_KEY or ""
+    }
+
+    # If video file was uploaded, send it to Cloud Run
+    # If video URL, just send the URL
+    if video_filename is not None:
+        logger.info(f"[Prepare {lecture_id}] Reading video file from: {video_path_or_url}")
+        if not os.path.exists(video_path_or_url):
+            raise FileNotFoundError(f"Video file missing: {video_path_or_url}")
+
+        # Stream the file from disk; httpx reads it in chunks and sets Content-Length from its size
+        logger.info(f"[Prepare {lecture_id}] Uploading {os.path.getsize(video_path_or_url)} bytes of video")
+        with open(video_path_or_url, 'rb') as video_file:
+            files = {
+                "video_file": (video_filename, video_file, "video/mp4")
+            }
+            response = await _external_http.post(
+                f"{settings.EXTERNAL_SERVICE_URL}/process-lecture-complete/",
+                data=data,
+                files=files
+            )
+    else:
+        data["video_url"] = video_path_or_url
+        response = await _external_http.post(
+            f"{settings.EXTERNAL_SERVICE_URL}/process-lecture-complete/",
+            data=data
+        )
+
+    response.raise_for_status()
+    logger.info(f"[Prepare {lecture_id}] Triggered external processing: {response.status_code}")
+
+
+async def _store_slide_ocr(db: AsyncSession, lecture_id: int, slide_rows: List[Dict[str, Any]]) -> None:
+    """OCRs all slides concurrently and saves slides.ocr_text in one batched UPDATE. Failures are non-fatal."""
+    if not OCR_AVAILABLE or not slide_rows:
+        return
+    try:
+        texts = await asyncio.gather(*(
+            extract_text_from_image_bytes_async(row["image_data"]) for row in slide_rows
+        ))
+        slides = Slide.__table__
+        await db.execute(
+            update(slides)
+            .where(slides.c.lecture_id == bindparam("b_lecture_id"), slides.c.index == bindparam("b_index"))
+            .values(ocr_text=bindparam("b_ocr_text")),
+            [
+                {"b_lecture_id": lecture_id, "b_index": row["index"], "b_ocr_text": text}
+                for row, text in zip(slide_rows, texts)
+            ]
+        )
+        await db.commit()
+        logger.info(f"[Prepare {lecture_id}] Stored OCR text for {len(texts)} slides.")
+    except Exception as e:
+        logger.warning(f"[Prepare {lecture_id}] Slide OCR failed; summaries will OCR on demand: {e}")
+        await db.rollback()
+
+
+async def prepare_lecture_background(
+    lecture_id: int,
+    presentation_content: bytes,
+    file_extension: str,
+    video_path_or_url: str,
+    video_filename: Optional[str] = None
+):
+    """
+    Background task run after /transcribe/ responds: renders and saves the slides,
+    then starts audio/matching (external service, or the local worker pool).
+    video_filename is set when video_path_or_url is an uploaded temp file.
+    Status: uploaded -> rendering_slides -> processing (-> completed/failed by the pipeline).
+    """
+    handed_off = False
+    db: Optional[AsyncSession] = None
+
+    try:
+        db = AsyncSessionLocal()
+        await update_lecture_status_async(db, lecture_id, "rendering_slides")
+
+        # 1. Render and save slides
+        slide_images = await presentation_service.process_presentation(presentation_content, file_extension)
+        slide_rows = []
+        for i, img in enumerate(slide_images):
+            image_mime, image_bytes = split_data_url(img)
+            slide_rows.append({"lecture_id": lecture_id, "index": i, "image_data": image_bytes, "image_mime": image_mime})
+        del slide_images  # Data URL strings are no longer needed once decoded
+        await bulk_insert_rows_async(db, Slide, slide_rows)
+        # Commits the slides together with the status change
+        if not await update_lecture_status_async(db, lecture_id, "processing"):
+            raise RuntimeError("Could not save slides")
+        logger.info(f"[Prepare {lecture_id}] Saved {len(slide_rows)} slides.")
+
+        # 2. Start audio extraction, transcription and matching
+        if not settings.EXTERNAL_SERVICE_URL:
+            # No external service configured: run the pipeline in a local worker process.
+            # The worker owns the temp video file and removes it when done.
+            submit_video_processing(video_path_or_url, lecture_id)
+            handed_off = True
+            logger.info(f"[Prepare {lecture_id}] Queued local processing.")
+        else:
+            # The service only needs the slide indices; images stay in the DB
+            slides_list = [{"index": row["index"]} for row in slide_rows]
+            await _dispatch_external_processing(lecture_id, slides_list, video_path_or_url, video_filename)
+
+        # 3. OCR every slide while the video is processed, so summarize requests never wait on Tesseract
+        await _store_slide_ocr(db, lecture_id, slide_rows)
+
+    except Exception as e:
+        logger.error(f"[Prepare {lecture_id}] Failed: {e}", exc_info=True)
+        if db:
+            try:
+                await db.rollback()
+            except Exception:
+                logger.error(f"[Prepare {lecture_id}] Rollback failed during error handling.")
+            await update_lecture_status_async(db, lecture_id, "failed")
+    finally:
+        # The external service received its own copy; the local worker deletes the file itself
+        if video_filename is not None and not handed_off and os.path.exists(video_path_or_url):
+            try:
+                os.unlink(video_path_or_url)
+                logger.info(f"[Prepare {lecture_id}] Cleaned up temp video file: {video_path_or_url}")
+            except Exception as cleanup_err:
+                logger.warning(f"[Prepare {lecture_id}] Failed to cleanup temp video file {video_path_or_url}: {cleanup_err}")
+        if db:
+            await db.close()
@@ -4,6 +4,7 @@ from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from sqlalchemy import text
 from app.db.connection import async_engine, async_database_url
+from app.db.http_client import supabase_http
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -13,8 +14,6 @@ async def database_health_check():
     """
     Test database connectivity using both direct and HTTP approaches.
     """
-    from app.db.http_client import supabase_http
-    
     results = {}
     
     # Test HTTP approach (should work)
@@ -3,77 +3,109 @@
 Internal API endpoints for communication between external service and main backend.
 These endpoints are called by the Cloud Run external service.
 """
+import asyncio
+import base64
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+import os
+import tempfile
+
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, List, Optional
 
-from app.utils.common import get_db
-from app.db.models import Lecture, TranscriptionSegment
+from app.utils.common import get_async_db
+from app.db.models import Lecture
 from app.services.transcription import TranscriptionService
-from app.utils.database import update_lecture_status
+from app.services.registry import get_transcription_service
+from app.utils.database import update_lecture_status_async, upsert_transcription_segments_async
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-transcription_service = TranscriptionService()
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write bytes straight to a file descriptor, bypassing Python's file buffering."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
 
 
 @router.post("/transcribe-audio")
 async def transcribe_audio_internal(
-    data: Dict[str, Any],
-    authorization: Optional[str] = Header(None)
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    transcription_service: TranscriptionService = Depends(get_transcription_service)
 ) -> Dict[str, Any]:
     """
-    Internal endpoint to transcribe base64 audio data.
-    Called by external service.
+    Internal endpoint to transcribe audio.
+    Called by external service. The request body is the raw audio file
+    (e.g. audio/mpeg or application/octet-stream) and is streamed straight to disk;
+    a JSON body with base64 "audio_data" is still accepted for older callers.
     """
+    audio_path: Optional[str] = None
+    fd: Optional[int] = None
     try:
         # Optional: Add API key validation here
         # if authorization != f"Bearer {settings.INTERNAL_API_KEY}":
         #     raise HTTPException(status_code=401, detail="Unauthorized")
 
-        audio_base64 = data.get("audio_data")
-        if not audio_base64:
-            raise HTTPException(status_code=400, detail="audio_data is required")
-
-        logger.info(f"Transcribing audio (base64 length: {len(audio_base64)} chars)")
-
-        # Decode base64 and save to temp file
-        import base64
-        import tempfile
-        import os
-
-        audio_bytes = base64.b64decode(audio_base64)
-        logger.info(f"Decoded audio: {len(audio_bytes)} bytes")
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-            tmp_file.write(audio_bytes)
-            audio_path = tmp_file.name
-
-        logger.info(f"Saved audio to temp file: {audio_path}")
+        # TranscriptionService.transcribe takes a file path, so the audio goes to disk
+        # once, written through the descriptor mkstemp already opened
+        fd, audio_path = tempfile.mkstemp(suffix=".mp3")
+
+        if request.headers.get("content-type", "").startswith("application/json"):
+            data = await request.json()
+            audio_base64 = data.get("audio_data")
+            if not audio_base64:
+                raise HTTPException(status_code=400, detail="audio_data is required")
+
+            logger.info(f"Transcribing audio (base64 length: {len(audio_base64)} chars)")
+            audio_bytes = base64.b64decode(audio_base64)
+            del data, audio_base64
+            await asyncio.get_running_loop().run_in_executor(None, _write_all, fd, audio_bytes)
+            os.close(fd)
+            fd = None
+            bytes_written = len(audio_bytes)
+            del audio_bytes
+        else:
+            bytes_written = 0
+            # aiofiles takes ownership of the descriptor and closes it
+            raw_fd, fd = fd, None
+            async with aiofiles.open(raw_fd, 'wb') as audio_file:
+                async for chunk in request.stream():
+                    bytes_written += len(chunk)
+                    await audio_file.write(chunk)
+            if not bytes_written:
+                raise HTTPException(status_code=400, detail="Audio body is required")
+
+        logger.info(f"Saved audio to temp file: {audio_path} ({bytes_written} bytes)")
 
         # Transcribe
         result = await transcription_service.transcribe(audio_path)
         logger.info(f"Transcription complete: {len(result.get('segments', []))} segments")
 
-        # Cleanup
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            logger.info(f"Cleaned up temp file: {audio_path}")
-
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in transcribe_audio_internal: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Cleanup
+        if fd is not None:
+            os.close(fd)
+        if audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+            logger.info(f"Cleaned up temp file: {audio_path}")
 
 
 @router.post("/complete-lecture-processing")
 async def complete_lecture_processing(
     data: Dict[str, Any],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(None)
 ) -> Dict[str, Any]:
     """
@@ -95,42 +127,21 @@ async def complete_lecture_processing(
 
         logger.info(f"Receiving completion for lecture {lecture_id}: status={status}, segments={len(segments)}")
 
-        if status == "completed" and segments:
-            # Save segments to database
-            logger.info(f"Deleting existing segments for lecture {lecture_id}")
-            db.query(TranscriptionSegment).filter(
-                TranscriptionSegment.lecture_id == lecture_id
-            ).delete()
-
-            segments_to_add = [
-                TranscriptionSegment(
-                    lecture_id=lecture_id,
-                    start_time=seg.get("start_time"),
-                    end_time=seg.get("end_time"),
-                    text=seg.get("text", ""),
-                    confidence=seg.get("confidence", 1.0),
-                    slide_index=seg.get("slide_index", 0)
-                )
-                for seg in segments
-            ]
-
-            if segments_to_add:
-                db.add_all(segments_to_add)
-                logger.info(f"Adding {len(segments_to_add)} segments to database")
-
-            update_lecture_status(db, lecture_id, "completed")
-            db.commit()
-
-            logger.info(f"Lecture {lecture_id} completed successfully: saved {len(segments_to_add)} segments")
+        if status == "completed":
+            # Upsert on (lecture_id, start_time); segments from earlier runs that are not in this set are pruned
+            saved_count = await upsert_transcription_segments_async(db, lecture_id, segments)
+            # Commits the segments together with the status change
+            await update_lecture_status_async(db, lecture_id, "completed")
+
+            logger.info(f"Lecture {lecture_id} completed successfully: saved {saved_count} segments")
 
         elif status == "failed":
-            update_lecture_status(db, lecture_id, "failed")
-            db.commit()
+            await update_lecture_status_async(db, lecture_id, "failed")
             logger.error(f"Lecture {lecture_id} failed: {error}")
 
         return {"status": "success", "lecture_id": lecture_id}
 
     except Exception as e:
         logger.error(f"Error in complete_lecture_processing: {str(e)}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
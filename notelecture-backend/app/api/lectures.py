@@ -1,14 +1,20 @@
 # app/api/lectures.py
 import os
+import time
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.orm import selectinload
 
-from app.utils.common import get_db, get_async_db
+from app.utils.common import get_async_db, get_async_read_db
+from app.db.connection import AsyncReadSessionLocal, AsyncSessionLocal
+from app.utils.images import to_data_url
 from app.db.models import Lecture, Slide, TranscriptionSegment, User
 from app.auth import current_active_user
 from app.schemas import UpdateLectureRequest
@@ -16,10 +22,50 @@ from app.schemas import UpdateLectureRequest
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Server-sent events for lectures that are still processing
+EVENTS_POLL_INTERVAL_SECONDS = 3
+EVENTS_MAX_DURATION_SECONDS = 30 * 60
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+# Column set and JSON shape shared by every endpoint that returns segments
+SEGMENT_COLUMNS = (
+    TranscriptionSegment.id, TranscriptionSegment.start_time, TranscriptionSegment.end_time,
+    TranscriptionSegment.text, TranscriptionSegment.confidence, TranscriptionSegment.slide_index
+)
+
+
+def _segment_dict(seg_id, start_time, end_time, text, confidence, slide_index) -> Dict[str, Any]:
+    return {
+        "id": seg_id, "startTime": start_time, "endTime": end_time,
+        "text": text, "confidence": confidence, "slideIndex": slide_index
+    }
+
+
+def _segments_stream_query(lecture_id: int):
+    return (
+        select(*SEGMENT_COLUMNS)
+        .filter(TranscriptionSegment.lecture_id == lecture_id)
+        .order_by(TranscriptionSegment.start_time)
+        .execution_options(yield_per=500)
+    )
+
+
+async def _get_user_lecture(db: AsyncSession, lecture_id: int, current_user: User) -> Optional[Lecture]:
+    """Fetch a lecture owned by the current user, or None."""
+    result = await db.execute(
+        select(Lecture).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id))
+    )
+    return result.scalar_one_or_none()
+
 
 @router.get("/lectures/")
 async def get_user_lectures(
-    db: AsyncSession = Depends(get_async_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, Any]:
     """Get all lectures for the current user."""
@@ -46,45 +92,251 @@ async def get_user_lectures(
 @router.get("/lectures/{lecture_id}/transcription")
 async def get_lecture_transcription(
     lecture_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(current_active_user)
-) -> Dict[str, Any]:
+) -> Response:
     """Retrieve lecture data including metadata, slides, and transcription."""
-    lecture = db.query(Lecture).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id)).first()
+    # Slides and segments are eager-loaded (pre-sorted by the relationship order_by) with the lecture
+    result = await db.execute(
+        select(Lecture)
+        .filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id))
+        .options(selectinload(Lecture.slides), selectinload(Lecture.transcription_segments))
+    )
+    lecture = result.scalar_one_or_none()
     if not lecture:
         raise HTTPException(status_code=404, detail="Lecture not found")
 
     logger.info(f"Fetching lecture {lecture_id} (Status: {lecture.status})")
 
     try:
-        slides = db.query(Slide).filter(Slide.lecture_id == lecture_id).order_by(Slide.index).all()
-        segments = db.query(TranscriptionSegment).filter(TranscriptionSegment.lecture_id == lecture_id).order_by(TranscriptionSegment.start_time).all()
+        slides = lecture.slides
+        segments = lecture.transcription_segments
 
-        return {
+        payload = {
             "lecture_id": lecture.id,
             "title": lecture.title,
             "status": lecture.status,
             "notes": lecture.notes,
-            "slides": [{"imageUrl": s.image_data, "index": s.index, "summary": s.summary} for s in slides],
-            "transcription": [{
-                "id": seg.id, "startTime": seg.start_time, "endTime": seg.end_time,
-                "text": seg.text, "confidence": seg.confidence, "slideIndex": seg.slide_index
-             } for seg in segments]
+            "slides": [{"imageUrl": s.image_url, "index": s.index, "summary": s.summary} for s in slides],
+            "transcription": [
+                _segment_dict(seg.id, seg.start_time, seg.end_time, seg.text, seg.confidence, seg.slide_index)
+                for seg in segments
+            ]
         }
+        # Serialize directly; the base64 slide images make response-model encoding expensive
+        return Response(content=orjson.dumps(payload), media_type="application/json")
     except Exception as e:
         logger.error(f"Error retrieving data for lecture {lecture_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving lecture data: {str(e)}")
 
 
+@router.get("/lectures/{lecture_id}")
+async def get_lecture(
+    lecture_id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(current_active_user)
+) -> Dict[str, Any]:
+    """Lecture metadata only (no slide images or segments); slide_count is for paging /slides."""
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
+    if not lecture:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+
+    try:
+        slide_count = (await db.execute(
+            select(func.count()).select_from(Slide).filter(Slide.lecture_id == lecture_id)
+        )).scalar_one()
+        return {
+            "lecture_id": lecture.id,
+            "title": lecture.title,
+            "status": lecture.status,
+            "notes": lecture.notes,
+            "slide_count": slide_count
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving lecture {lecture_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error retrieving lecture: {str(e)}")
+
+
+@router.get("/lectures/{lecture_id}/slides")
+async def get_lecture_slides(
+    lecture_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(current_active_user)
+) -> Dict[str, Any]:
+    """A page of slides ordered by index."""
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
+    if not lecture:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+
+    try:
+        result = await db.execute(
+            select(Slide.index, Slide.image_data, Slide.image_mime, Slide.summary)
+            .filter(Slide.lecture_id == lecture_id)
+            .order_by(Slide.index)
+            .offset(offset)
+            .limit(limit)
+        )
+        return {
+            "offset": offset,
+            "limit": limit,
+            "slides": [
+                {"imageUrl": to_data_url(image_mime, image_data), "index": index, "summary": summary}
+                for index, image_data, image_mime, summary in result.all()
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving slides for lecture {lecture_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error retrieving slides: {str(e)}")
+
+
+@router.get("/lectures/{lecture_id}/segments")
+async def stream_lecture_segments(
+    lecture_id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(current_active_user)
+) -> StreamingResponse:
+    """Transcription segments ordered by start time, streamed as newline-delimited JSON."""
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
+    if not lecture:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+
+    async def generate() -> AsyncIterator[bytes]:
+        # The request-scoped session is closed once the handler returns, so stream with our own
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                segment_rows = await stream_db.stream(_segments_stream_query(lecture_id))
+                async for row in segment_rows:
+                    yield orjson.dumps(_segment_dict(*row)) + b"\n"
+            except Exception as e:
+                logger.error(f"Error streaming segments for lecture {lecture_id}: {e}", exc_info=True)
+                yield orjson.dumps({"error": f"Error retrieving segments: {str(e)}"}) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/lectures/{lecture_id}/transcription/stream")
+async def stream_lecture_transcription(
+    lecture_id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(current_active_user)
+) -> StreamingResponse:
+    """
+    Same data as /transcription, streamed as newline-delimited JSON so long lectures
+    are never materialized in memory. One record per line, tagged by "type":
+    a "lecture" header, then each "slide", then each "segment" ordered by start time.
+    """
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
+    if not lecture:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+
+    header = {
+        "type": "lecture", "lecture_id": lecture.id, "title": lecture.title,
+        "status": lecture.status, "notes": lecture.notes
+    }
+
+    async def generate() -> AsyncIterator[bytes]:
+        yield orjson.dumps(header) + b"\n"
+        # The request-scoped session is closed once the handler returns, so stream with our own
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                slide_rows = await stream_db.stream(
+                    select(Slide.index, Slide.image_data, Slide.image_mime, Slide.summary)
+                    .filter(Slide.lecture_id == lecture_id)
+                    .order_by(Slide.index)
+                    .execution_options(yield_per=50)
+                )
+                async for index, image_data, image_mime, summary in slide_rows:
+                    image_url = to_data_url(image_mime, image_data)
+                    yield orjson.dumps({"type": "slide", "imageUrl": image_url, "index": index, "summary": summary}) + b"\n"
+
+                segment_rows = await stream_db.stream(_segments_stream_query(lecture_id))
+                async for row in segment_rows:
+                    yield orjson.dumps({"type": "segment", **_segment_dict(*row)}) + b"\n"
+            except Exception as e:
+                logger.error(f"Error streaming data for lecture {lecture_id}: {e}", exc_info=True)
+                yield orjson.dumps({"type": "error", "detail": f"Error retrieving lecture data: {str(e)}"}) + b"\n"
+
+    logger.info(f"Streaming lecture {lecture_id} (Status: {lecture.status})")
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/lectures/{lecture_id}/events")
+async def lecture_events(
+    lecture_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(current_active_user)
+) -> StreamingResponse:
+    """
+    Server-sent events for a lecture: "status" whenever the processing status changes,
+    "segment" for each transcription segment as soon as it is stored, and a final "done".
+    Lets clients follow processing without re-polling the full lecture payload.
+    """
+    result = await db.execute(
+        select(Lecture.status).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id))
+    )
+    initial_status = result.scalar_one_or_none()
+    if initial_status is None:
+        raise HTTPException(status_code=404, detail="Lecture not found")
+
+    async def generate() -> AsyncIterator[bytes]:
+        last_status: Optional[str] = None
+        last_start_time = float("-inf")
+        deadline = time.monotonic() + EVENTS_MAX_DURATION_SECONDS
+
+        while time.monotonic() < deadline:
+            if await request.is_disconnected():
+                logger.info(f"Event stream for lecture {lecture_id} closed by client")
+                return
+
+            # Short-lived session per poll so no connection is held between polls
+            async with AsyncReadSessionLocal() as poll_db:
+                status = (await poll_db.execute(
+                    select(Lecture.status).filter(Lecture.id == lecture_id)
+                )).scalar_one_or_none()
+                new_segments = (await poll_db.execute(
+                    select(*SEGMENT_COLUMNS)
+                    .filter(TranscriptionSegment.lecture_id == lecture_id, TranscriptionSegment.start_time > last_start_time)
+                    .order_by(TranscriptionSegment.start_time)
+                )).all()
+
+            if status is None:
+                yield _sse_event("error", {"detail": "Lecture not found"})
+                return
+            if status != last_status:
+                last_status = status
+                yield _sse_event("status", {"lecture_id": lecture_id, "status": status})
+            for row in new_segments:
+                last_start_time = row.start_time
+                yield _sse_event("segment", _segment_dict(*row))
+
+            if status in TERMINAL_STATUSES:
+                yield _sse_event("done", {"lecture_id": lecture_id, "status": status})
+                return
+
+            yield b": keep-alive\n\n"
+            await asyncio.sleep(EVENTS_POLL_INTERVAL_SECONDS)
+
+        yield _sse_event("timeout", {"lecture_id": lecture_id, "status": last_status})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/lectures/{lecture_id}")
 async def update_lecture(
     lecture_id: int,
     request: UpdateLectureRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, Any]:
     """Update lecture title and/or notes."""
-    lecture = db.query(Lecture).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id)).first()
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
     if not lecture:
         raise HTTPException(status_code=404, detail="Lecture not found")
     
@@ -94,7 +346,7 @@ async def update_lecture(
         if request.notes is not None:
             lecture.notes = request.notes
             
-        db.commit()
+        await db.commit()
         logger.info(f"Updated lecture {lecture_id} for user {current_user.id}")
         
         return {
@@ -105,7 +357,7 @@ async def update_lecture(
             "notes": lecture.notes
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating lecture {lecture_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error updating lecture: {str(e)}")
 
@@ -113,11 +365,11 @@ async def update_lecture(
 @router.delete("/lectures/{lecture_id}")
 async def delete_lecture(
     lecture_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, str]:
     """Delete a lecture and all its associated data."""
-    lecture = db.query(Lecture).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id)).first()
+    lecture = await _get_user_lecture(db, lecture_id, current_user)
     if not lecture:
         raise HTTPException(status_code=404, detail="Lecture not found")
     
@@ -131,13 +383,19 @@ async def delete_lecture(
                 except Exception as file_err:
                     logger.warning(f"Could not delete video file {lecture.video_path}: {file_err}")
         
-        # Database cascades will handle slides and transcription_segments deletion
-        db.delete(lecture)
-        db.commit()
+        # Delete children with set-based statements instead of loading them for the ORM cascade
+        await db.execute(delete(TranscriptionSegment).where(TranscriptionSegment.lecture_id == lecture_id))
+        await db.execute(delete(Slide).where(Slide.lecture_id == lecture_id))
+        await db.execute(delete(Lecture).where(Lecture.id == lecture_id))
+        await db.execute(
+            update(User).where(User.id == current_user.id, User.total_lectures_ever > 0)
+            .values(total_lectures_ever=User.total_lectures_ever - 1)
+        )
+        await db.commit()
         
         logger.info(f"Deleted lecture {lecture_id} for user {current_user.id}")
         return {"message": "Lecture deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error deleting lecture {lecture_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error deleting lecture: {str(e)}")
\ No newline at end of file
@@ -1,18 +1,62 @@
 # app/api/oauth.py
+import hashlib
 import logging
-import urllib.request
-import urllib.error
-import json
+from typing import Optional, Tuple
+
+import httpx
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from httpx_oauth.oauth2 import OAuth2RequestError
 
 from app.auth import google_oauth_client, auth_backend, get_user_manager
 from app.core.config import settings
+from app.db.http_client import supabase_http
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+
+# Shared client so logins reuse a warm connection to googleapis.com
+_http = httpx.AsyncClient(
+    timeout=httpx.Timeout(10.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=20),
+    headers={"User-Agent": "NoteLecture/1.0"},
+)
+
+# sha256(access token) -> (email, google user id)
+_userinfo_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+async def _fetch_google_userinfo(token: str) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (email, google_id) for an access token."""
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    cached = _userinfo_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await _http.get(GOOGLE_USERINFO_URL, headers={"Authorization": f"Bearer {token}"})
+    except httpx.HTTPError as net_err:
+        logger.error(f"Network error when fetching user info: {net_err}")
+        raise HTTPException(status_code=500, detail="Network error connecting to Google")
+
+    if response.status_code != 200:
+        logger.error(f"UserInfo API returned status {response.status_code}: {response.text}")
+        raise HTTPException(status_code=400, detail=f"Google API error: {response.reason_phrase}")
+
+    user_data = response.json()
+    userinfo = (user_data.get("email"), user_data.get("id"))
+    if userinfo[0]:
+        _userinfo_cache.set(cache_key, userinfo)
+    return userinfo
+
+
+async def close_http_client():
+    """Closes the shared Google client. Called on application shutdown."""
+    await _http.aclose()
+
 @router.get("/authorize")
 async def google_authorize(request: Request):
     """Get Google OAuth authorization URL"""
@@ -37,20 +81,16 @@ async def google_callback(
 ):
     """Handle Google OAuth callback and redirect to frontend"""
     try:
-        logger.info(f"OAuth callback received: {request.url}")
+        logger.info("OAuth callback received")
         
         # Get access token from Google
         redirect_uri = f"{request.url.scheme}://{request.url.netloc}/api/auth/google/callback"
-        logger.info(f"Using redirect_uri: {redirect_uri}")
-        logger.info(f"Request URL query: {request.url.query}")
-        logger.info(f"Full request URL: {request.url}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Using redirect_uri: {redirect_uri}")
         
         try:
-            # Extract the authorization code from the query parameters
-            from urllib.parse import parse_qs
-            parsed_query = parse_qs(request.url.query)
-            auth_code = parsed_query.get('code', [None])[0]
-            logger.info(f"Extracted auth_code: {auth_code}")
+            # Starlette has already parsed the query string
+            auth_code = request.query_params.get("code")
             
             if not auth_code:
                 raise ValueError("No authorization code received")
@@ -69,13 +109,8 @@ async def google_callback(
             raise
         
         logger.info("Successfully obtained access token from Google")
-        logger.info(f"Access token type: {type(access_token)}")
-        logger.info(f"Access token (first 20 chars): {str(access_token)[:20]}...")
-        
-        # Get user info from Google - bypass httpx issues by using urllib directly
-        import urllib.request
-        import json
         
+        # Get user info from Google (pooled client, cached per access token)
         user_email = None
         user_id = None
         
@@ -84,39 +119,9 @@ async def google_callback(
             token_to_use = access_token
             if isinstance(access_token, dict):
                 token_to_use = access_token.get("access_token")
-                logger.info(f"Extracted token from dict: {token_to_use[:20] if token_to_use else 'None'}...")
             
-            # Use urllib directly to avoid httpx network issues in Vercel
-            logger.info("Fetching user info using urllib (bypassing httpx)")
-            
-            req = urllib.request.Request(
-                "https://www.googleapis.com/oauth2/v2/userinfo",
-                headers={
-                    "Authorization": f"Bearer {token_to_use}",
-                    "User-Agent": "NoteLecture/1.0"
-                }
-            )
-            
-            try:
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    if response.status == 200:
-                        user_data = json.loads(response.read().decode())
-                        user_email = user_data.get("email")
-                        user_id = user_data.get("id")
-                        logger.info(f"Successfully got user info via urllib: {user_email}")
-                    else:
-                        logger.error(f"UserInfo API returned status: {response.status}")
-                        raise HTTPException(status_code=400, detail="Failed to get user info from Google")
-            except urllib.error.HTTPError as http_err:
-                logger.error(f"HTTP error when fetching user info: {http_err.code} - {http_err.reason}")
-                logger.error(f"Response body: {http_err.read().decode()}")
-                raise HTTPException(status_code=400, detail=f"Google API error: {http_err.reason}")
-            except urllib.error.URLError as url_err:
-                logger.error(f"URL error when fetching user info: {url_err.reason}")
-                raise HTTPException(status_code=500, detail="Network error connecting to Google")
-            except Exception as e:
-                logger.error(f"Unexpected error with urllib: {e}")
-                raise HTTPException(status_code=500, detail="Failed to fetch user info")
+            user_email, user_id = await _fetch_google_userinfo(token_to_use)
+            logger.info(f"Successfully got user info: {user_email}")
             
             if not user_email:
                 logger.error("No email in user data response")
@@ -131,23 +136,15 @@ async def google_callback(
             raise HTTPException(status_code=500, detail="Authentication error")
         
         # Use HTTP-based approach to bypass Vercel networking issues
-        from app.db.http_client import supabase_http
         
         logger.info("Using HTTP-based database access for OAuth")
         
         try:
-            # Check if user exists via HTTP
-            existing_user = await supabase_http.get_user_by_email(user_email)
-            
-            if existing_user:
-                logger.info(f"Found existing user via HTTP: {user_email}")
-                user_id = existing_user["id"]
-            else:
-                # Create new user via HTTP
-                logger.info(f"Creating new user via HTTP: {user_email}")
-                new_user = await supabase_http.create_user(user_email)
-                user_id = new_user["id"]
-                logger.info(f"Created new user successfully via HTTP: {user_email}")
+            # create_oauth_user returns the existing row or inserts one, so a single round trip
+            # covers both new and returning users (no get_user_by_email pre-check)
+            oauth_user = await supabase_http.create_oauth_user(user_email)
+            user_id = oauth_user["id"]
+            logger.info(f"Resolved OAuth user via HTTP: {user_email}")
             
             # Create a minimal user object for JWT token generation
             class SimpleUser:
@@ -174,7 +171,7 @@ async def google_callback(
         
         # Redirect to frontend with token
         redirect_url = f"{settings.FRONTEND_URL}/oauth/callback?token={jwt_token}"
-        logger.info(f"Redirecting to: {redirect_url}")
+        logger.info("Redirecting to frontend OAuth callback")
         return RedirectResponse(
             url=redirect_url,
             status_code=302
@@ -1,22 +1,74 @@
 # app/api/subscriptions.py
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, List
+from decimal import Decimal
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session, selectinload
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, update, text
 from pydantic import BaseModel
 
-from app.utils.common import get_db, get_async_db
-from app.db.models import SubscriptionPlan, UserSubscription, User, Lecture, Payment
+from app.utils.common import get_async_db, get_async_read_db
+from app.db.models import SubscriptionPlan, UserSubscription, User, Payment
 from app.auth import current_active_user
 from app.services.paypal import paypal_service
+from app.utils.cache import TTLCache
+from app.schemas import (
+    SubscriptionPlanResponse, SubscriptionPlansResponse, SubscriptionStatusResponse,
+    UsageStatsResponse, CancelSubscriptionResponse
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Plans only change when migrations/seed scripts run, so the list is cached per worker
+PLANS_CACHE_TTL_SECONDS = 60 * 60
+_plans_cache = TTLCache(maxsize=2, ttl=PLANS_CACHE_TTL_SECONDS)
+_stale_plans: Optional[Tuple[bytes, str]] = None  # Last good (body, ETag), served if the DB is unreachable
+PLANS_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+
+
+class ActivePlan(NamedTuple):
+    id: int
+    name: str
+    duration_days: int
+    price: Decimal
+    lecture_limit: int
+
+
+class PlanCatalog(NamedTuple):
+    by_id: Dict[int, ActivePlan]
+    by_price: Dict[Decimal, ActivePlan]
+
+
+def invalidate_plans_cache() -> None:
+    """Drop the cached plans and plan list (call after changing subscription_plans)."""
+    global _stale_plans
+    _plans_cache.clear()
+    _stale_plans = None
+
+
+# The active subscription is read on every dashboard load (/status then /usage);
+# a short TTL keeps lectures_used close to live for anything not invalidated explicitly
+ACTIVE_SUBSCRIPTION_CACHE_TTL_SECONDS = 30
+_active_subscription_cache = TTLCache(maxsize=4096, ttl=ACTIVE_SUBSCRIPTION_CACHE_TTL_SECONDS)
+_MISSING = object()
+
+
+def invalidate_active_subscription(user_id: str) -> None:
+    """Drop a user's cached subscription (call after changing their subscription or its usage)."""
+    _active_subscription_cache.pop(str(user_id))
+
+
+# Headers PayPal sends with every signed webhook delivery
+PAYPAL_WEBHOOK_HEADERS = ("paypal-transmission-id", "paypal-transmission-sig", "paypal-cert-url")
+
+
 # Pydantic models for payment requests
 class PaymentRequest(BaseModel):
     return_url: str
@@ -26,69 +78,164 @@ class PaymentExecuteRequest(BaseModel):
     payment_id: str
     payer_id: str
 
+class ActiveSubscription(BaseModel):
+    """Plain snapshot of an active subscription and its plan, safe to cache outside a session."""
+    id: int
+    plan_id: int
+    plan_name: str
+    lecture_limit: int
+    start_date: datetime
+    end_date: datetime
+    lectures_used: int
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        return (now or datetime.utcnow()) > self.end_date
+
+    def days_remaining(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        if self.is_expired(now):
+            return 0
+        return (self.end_date - now).days
+
+
+async def get_active_subscription(
+    db: AsyncSession, user_id: str, now: Optional[datetime] = None
+) -> Optional[UserSubscription]:
+    """The user's current active subscription (with its plan joined in), or None."""
+    now = now or datetime.utcnow()
+    result = await db.execute(
+        select(UserSubscription).options(joinedload(UserSubscription.plan)).filter(
+            UserSubscription.user_id == user_id,
+            UserSubscription.is_active == True,
+            UserSubscription.start_date <= now,
+            UserSubscription.end_date >= now
+        ).order_by(UserSubscription.end_date.desc()).limit(1)
+    )
+    return result.scalar_one_or_none()
+
 
-@router.get("/subscriptions/plans")
+async def get_active_subscription_cached(db: AsyncSession, user_id: str) -> Optional[ActiveSubscription]:
+    """Cached snapshot of the user's active subscription, or None if they have none."""
+    cached = _active_subscription_cache.get(user_id, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    sub = await get_active_subscription(db, user_id)
+    snapshot = None
+    if sub:
+        snapshot = ActiveSubscription(
+            id=sub.id,
+            plan_id=sub.plan.id,
+            plan_name=sub.plan.name,
+            lecture_limit=sub.plan.lecture_limit,
+            start_date=sub.start_date,
+            end_date=sub.end_date,
+            lectures_used=sub.lectures_used or 0,
+        )
+    _active_subscription_cache.set(user_id, snapshot)
+    return snapshot
+
+
+async def get_plan_catalog(db: AsyncSession) -> PlanCatalog:
+    """Active plans keyed by id and by price, loaded once per cache period."""
+    catalog = _plans_cache.get("catalog")
+    if catalog is None:
+        result = await db.execute(
+            select(
+                SubscriptionPlan.id, SubscriptionPlan.name, SubscriptionPlan.duration_days,
+                SubscriptionPlan.price, SubscriptionPlan.lecture_limit
+            ).filter(SubscriptionPlan.is_active == True).order_by(SubscriptionPlan.id)
+        )
+        plans = [ActivePlan(*row) for row in result.all()]
+        # If two plans share a price, the first one (lowest id) wins, as the old LIMIT 1 query did
+        by_price: Dict[Decimal, ActivePlan] = {}
+        for plan in plans:
+            by_price.setdefault(plan.price, plan)
+        catalog = PlanCatalog(by_id={plan.id: plan for plan in plans}, by_price=by_price)
+        _plans_cache.set("catalog", catalog)
+    return catalog
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches the etag (weak comparison, "*" matches anything)."""
+    for token in if_none_match.split(","):
+        token = token.strip()
+        if token == "*" or token.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@router.get("/subscriptions/plans", response_model=SubscriptionPlansResponse)
 async def get_subscription_plans(
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
-    """Get all available subscription plans."""
-    try:
-        plans = db.query(SubscriptionPlan).filter(SubscriptionPlan.is_active == True).all()
-        
-        return {
-            "plans": [{
-                "id": plan.id,
-                "name": plan.name,
-                "duration_days": plan.duration_days,
-                "price": float(plan.price),
-                "lecture_limit": plan.lecture_limit,
-                "description": f"{plan.lecture_limit} lectures for {plan.duration_days} days"
-            } for plan in plans]
-        }
-    except Exception as e:
-        logger.error(f"Error retrieving subscription plans: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error retrieving plans: {str(e)}")
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db)
+) -> Response:
+    """Get all available subscription plans (ETag-validated, cacheable by browsers and the CDN)."""
+    global _stale_plans
+    cached = _plans_cache.get("plans")
+    if cached is None:
+        try:
+            plans = (await get_plan_catalog(db)).by_id.values()
 
+            payload = SubscriptionPlansResponse(plans=[
+                SubscriptionPlanResponse(
+                    id=plan.id,
+                    name=plan.name,
+                    duration_days=plan.duration_days,
+                    price=float(plan.price),
+                    lecture_limit=plan.lecture_limit,
+                    description=f"{plan.lecture_limit} lectures for {plan.duration_days} days"
+                ) for plan in plans
+            ])
+            body = orjson.dumps(payload.model_dump())
+            cached = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+            _plans_cache.set("plans", cached)
+            _stale_plans = cached
+        except Exception as e:
+            if _stale_plans is None:
+                logger.error(f"Error retrieving subscription plans: {e}", exc_info=True)
+                raise HTTPException(status_code=500, detail=f"Error retrieving plans: {str(e)}")
+            logger.warning(f"Serving stale subscription plans after DB error: {e}")
+            cached = _stale_plans
 
-@router.get("/subscriptions/status")
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": PLANS_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/subscriptions/status", response_model=SubscriptionStatusResponse, response_model_exclude_none=True)
 async def get_subscription_status(
-    db: AsyncSession = Depends(get_async_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(current_active_user)
-) -> Dict[str, Any]:
+) -> SubscriptionStatusResponse:
     """Get current user's subscription status and usage."""
     try:
         # Get current active subscription
         now = datetime.utcnow()
-        result = await db.execute(
-            select(UserSubscription).options(selectinload(UserSubscription.plan)).filter(
-                UserSubscription.user_id == str(current_user.id),
-                UserSubscription.is_active == True,
-                UserSubscription.start_date <= now,
-                UserSubscription.end_date >= now
-            )
-        )
-        current_sub = result.scalar_one_or_none()
+        current_sub = await get_active_subscription_cached(db, str(current_user.id))
 
         if current_sub:
-            return {
-                "has_subscription": True,
-                "plan_name": current_sub.plan.name,
-                "plan_id": current_sub.plan.id,
-                "start_date": current_sub.start_date.isoformat(),
-                "end_date": current_sub.end_date.isoformat(),
-                "lectures_used": current_sub.lectures_used,
-                "lectures_limit": current_sub.plan.lecture_limit,
-                "lectures_remaining": current_sub.plan.lecture_limit - current_sub.lectures_used,
-                "days_remaining": current_sub.days_remaining(),
-                "is_expired": current_sub.is_expired()
-            }
+            return SubscriptionStatusResponse(
+                has_subscription=True,
+                plan_name=current_sub.plan_name,
+                plan_id=current_sub.plan_id,
+                start_date=current_sub.start_date,
+                end_date=current_sub.end_date,
+                lectures_used=current_sub.lectures_used,
+                lectures_limit=current_sub.lecture_limit,
+                lectures_remaining=current_sub.lecture_limit - current_sub.lectures_used,
+                days_remaining=current_sub.days_remaining(now),
+                is_expired=current_sub.is_expired(now)
+            )
         else:
-            return {
-                "has_subscription": False,
-                "free_lectures_used": current_user.free_lectures_used,
-                "free_lectures_remaining": max(0, 3 - current_user.free_lectures_used),
-                "free_lectures_limit": 3
-            }
+            return SubscriptionStatusResponse(
+                has_subscription=False,
+                free_lectures_used=current_user.free_lectures_used,
+                free_lectures_remaining=max(0, 3 - current_user.free_lectures_used),
+                free_lectures_limit=3
+            )
     except Exception as e:
         logger.error(f"Error retrieving subscription status for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving subscription status: {str(e)}")
@@ -98,28 +245,19 @@ async def get_subscription_status(
 async def create_payment_order(
     plan_id: int,
     payment_request: PaymentRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, Any]:
     """Create a PayPal payment order for a subscription plan."""
     try:
         # Get the plan
-        plan = db.query(SubscriptionPlan).filter(
-            SubscriptionPlan.id == plan_id,
-            SubscriptionPlan.is_active == True
-        ).first()
+        plan = (await get_plan_catalog(db)).by_id.get(plan_id)
         
         if not plan:
             raise HTTPException(status_code=404, detail="Subscription plan not found")
         
         # Check if user already has an active subscription
-        now = datetime.utcnow()
-        current_sub = db.query(UserSubscription).filter(
-            UserSubscription.user_id == str(current_user.id),
-            UserSubscription.is_active == True,
-            UserSubscription.start_date <= now,
-            UserSubscription.end_date >= now
-        ).first()
+        current_sub = await get_active_subscription_cached(db, str(current_user.id))
         
         if current_sub:
             raise HTTPException(
@@ -127,12 +265,11 @@ async def create_payment_order(
                 detail="You already have an active subscription"
             )
         
-        # Create PayPal payment order
-        payment_result = paypal_service.create_payment_order(
-            user=current_user,
-            plan=plan,
-            return_url=payment_request.return_url,
-            cancel_url=payment_request.cancel_url
+        # Create PayPal payment order (the PayPal SDK and its DB writes are blocking)
+        loop = asyncio.get_running_loop()
+        payment_result = await loop.run_in_executor(
+            None, paypal_service.create_payment_order,
+            current_user, plan, payment_request.return_url, payment_request.cancel_url
         )
         
         if payment_result["success"]:
@@ -163,15 +300,15 @@ async def create_payment_order(
 @router.post("/payments/execute")
 async def execute_payment(
     payment_execute: PaymentExecuteRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, Any]:
     """Execute/capture PayPal payment and activate subscription."""
     try:
-        # Execute PayPal payment
-        execution_result = paypal_service.execute_payment(
-            payment_id=payment_execute.payment_id,
-            payer_id=payment_execute.payer_id
+        # Execute PayPal payment (the PayPal SDK and its DB writes are blocking)
+        loop = asyncio.get_running_loop()
+        execution_result = await loop.run_in_executor(
+            None, paypal_service.execute_payment, payment_execute.payment_id, payment_execute.payer_id
         )
         
         if not execution_result["success"]:
@@ -180,31 +317,41 @@ async def execute_payment(
                 detail=f"Payment execution failed: {execution_result['error']}"
             )
         
-        payment_record = execution_result["payment_record"]
+        # Serialize subscription changes per user for the rest of this transaction, so two
+        # concurrent executions can't both deactivate-and-insert
+        user_id_str = str(current_user.id)
+        await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:uid))"), {"uid": user_id_str})
+
+        # Load the payment record into this session (the service's session is already closed)
+        result = await db.execute(
+            select(Payment).filter(Payment.paypal_order_id == payment_execute.payment_id)
+        )
+        payment_record = result.scalar_one_or_none()
+        if not payment_record:
+            raise HTTPException(status_code=404, detail="Payment record not found")
+        if payment_record.subscription_id is not None:
+            raise HTTPException(status_code=409, detail="Payment has already been applied to a subscription")
         
         # Get the plan from the payment record's amount
-        # We need to find which plan matches the payment amount
-        plan = db.query(SubscriptionPlan).filter(
-            SubscriptionPlan.price == payment_record.amount,
-            SubscriptionPlan.is_active == True
-        ).first()
+        plan = (await get_plan_catalog(db)).by_price.get(payment_record.amount)
         
         if not plan:
             raise HTTPException(status_code=404, detail="Subscription plan not found for payment amount")
         
         # Deactivate any existing subscriptions
-        existing_subs = db.query(UserSubscription).filter(
-            UserSubscription.user_id == str(current_user.id)
-        ).all()
-        for sub in existing_subs:
-            sub.is_active = False
+        await db.execute(
+            update(UserSubscription)
+            .where(UserSubscription.user_id == user_id_str, UserSubscription.is_active == True)
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
         
         # Create new subscription
         start_date = datetime.utcnow()
         end_date = start_date + timedelta(days=plan.duration_days)
         
         new_subscription = UserSubscription(
-            user_id=str(current_user.id),
+            user_id=user_id_str,
             plan_id=plan.id,
             start_date=start_date,
             end_date=end_date,
@@ -213,11 +360,13 @@ async def execute_payment(
         )
         
         db.add(new_subscription)
+        await db.flush()  # Assigns new_subscription.id
         
         # Link payment to subscription
         payment_record.subscription_id = new_subscription.id
         
-        db.commit()
+        await db.commit()
+        invalidate_active_subscription(user_id_str)
         
         logger.info(f"User {current_user.id} payment executed and subscribed to plan {plan.name}")
         
@@ -239,129 +388,117 @@ async def execute_payment(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error executing payment for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing payment: {str(e)}")
 
 
-@router.get("/subscriptions/usage")
+@router.get("/subscriptions/usage", response_model=UsageStatsResponse, response_model_exclude_none=True)
 async def get_usage_stats(
-    db: AsyncSession = Depends(get_async_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(current_active_user)
-) -> Dict[str, Any]:
+) -> UsageStatsResponse:
     """Get detailed usage statistics for the current user."""
     try:
         # Get current active subscription
-        now = datetime.utcnow()
-        result = await db.execute(
-            select(UserSubscription).options(selectinload(UserSubscription.plan)).filter(
-                UserSubscription.user_id == str(current_user.id),
-                UserSubscription.is_active == True,
-                UserSubscription.start_date <= now,
-                UserSubscription.end_date >= now
-            )
-        )
-        current_sub = result.scalar_one_or_none()
+        current_sub = await get_active_subscription_cached(db, str(current_user.id))
 
-        # Get total lectures created by user
-        lecture_count_result = await db.execute(
-            select(func.count(Lecture.id)).filter(Lecture.user_id == str(current_user.id))
-        )
-        total_lectures = lecture_count_result.scalar()
+        # Maintained on lecture create/delete, so no count query is needed
+        total_lectures = current_user.total_lectures_ever or 0
 
         if current_sub:
-            return {
-                "subscription_type": "premium",
-                "plan_name": current_sub.plan.name,
-                "lectures_used_this_period": current_sub.lectures_used,
-                "lectures_limit": current_sub.plan.lecture_limit,
-                "lectures_remaining": current_sub.plan.lecture_limit - current_sub.lectures_used,
-                "total_lectures_ever": total_lectures,
-                "days_remaining": current_sub.days_remaining(),
-                "subscription_end": current_sub.end_date.isoformat()
-            }
+            return UsageStatsResponse(
+                subscription_type="premium",
+                plan_name=current_sub.plan_name,
+                lectures_used_this_period=current_sub.lectures_used,
+                lectures_limit=current_sub.lecture_limit,
+                lectures_remaining=current_sub.lecture_limit - current_sub.lectures_used,
+                total_lectures_ever=total_lectures,
+                days_remaining=current_sub.days_remaining(),
+                subscription_end=current_sub.end_date
+            )
         else:
-            return {
-                "subscription_type": "free",
-                "free_lectures_used": current_user.free_lectures_used,
-                "free_lectures_remaining": max(0, 3 - current_user.free_lectures_used),
-                "total_lectures_ever": total_lectures,
-                "needs_upgrade": current_user.free_lectures_used >= 3
-            }
+            return UsageStatsResponse(
+                subscription_type="free",
+                free_lectures_used=current_user.free_lectures_used,
+                free_lectures_remaining=max(0, 3 - current_user.free_lectures_used),
+                total_lectures_ever=total_lectures,
+                needs_upgrade=current_user.free_lectures_used >= 3
+            )
     except Exception as e:
         logger.error(f"Error retrieving usage stats for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving usage statistics: {str(e)}")
 
 
-@router.delete("/subscriptions/cancel")
+@router.delete("/subscriptions/cancel", response_model=CancelSubscriptionResponse)
 async def cancel_subscription(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
-) -> Dict[str, Any]:
+) -> CancelSubscriptionResponse:
     """Cancel the current user's subscription."""
     try:
         # Get current active subscription
-        now = datetime.utcnow()
-        current_sub = db.query(UserSubscription).filter(
-            UserSubscription.user_id == str(current_user.id),
-            UserSubscription.is_active == True,
-            UserSubscription.start_date <= now,
-            UserSubscription.end_date >= now
-        ).first()
+        user_id_str = str(current_user.id)
+        current_sub = await get_active_subscription(db, user_id_str)
         
         if not current_sub:
             raise HTTPException(status_code=404, detail="No active subscription found")
         
         # Deactivate the subscription
         current_sub.is_active = False
-        db.commit()
+        await db.commit()
+        invalidate_active_subscription(user_id_str)
         
         logger.info(f"User {current_user.id} cancelled subscription to {current_sub.plan.name}")
         
-        return {
-            "message": "Subscription cancelled successfully",
-            "cancelled_plan": current_sub.plan.name,
-            "access_until": current_sub.end_date.isoformat()
-        }
+        return CancelSubscriptionResponse(
+            message="Subscription cancelled successfully",
+            cancelled_plan=current_sub.plan.name,
+            access_until=current_sub.end_date
+        )
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error cancelling subscription for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error cancelling subscription: {str(e)}")
 
 
 @router.post("/payments/webhook")
 async def paypal_webhook(
-    request: Request,
-    db: Session = Depends(get_db)
+    request: Request
 ) -> Dict[str, str]:
     """Handle PayPal webhook notifications."""
+    # Reject unsigned requests before reading the body
+    if not all(header in request.headers for header in PAYPAL_WEBHOOK_HEADERS):
+        raise HTTPException(status_code=401, detail="Missing webhook signature headers")
+
     try:
         # Get request body and headers
         body = await request.body()
         headers = dict(request.headers)
         
-        # Verify webhook signature (simplified)
-        if not paypal_service.verify_webhook(headers, body.decode()):
+        # Verify webhook signature off the event loop (verification may call PayPal)
+        if not await asyncio.to_thread(paypal_service.verify_webhook, headers, body.decode()):
             raise HTTPException(status_code=401, detail="Invalid webhook signature")
         
         # Parse webhook data
-        import json
-        webhook_data = json.loads(body.decode())
+        webhook_data = orjson.loads(body)
         
         event_type = webhook_data.get('event_type')
         resource = webhook_data.get('resource', {})
         
-        # Process the webhook
-        success = paypal_service.process_webhook(event_type, resource)
+        # Process the webhook (the service updates payments with a sync session)
+        success = await asyncio.to_thread(paypal_service.process_webhook, event_type, resource)
         
         if success:
             return {"status": "success"}
         else:
             raise HTTPException(status_code=400, detail="Webhook processing failed")
             
-    except json.JSONDecodeError:
+    except HTTPException:
+        raise
+    except orjson.JSONDecodeError:
         logger.error("Invalid JSON in webhook body")
         raise HTTPException(status_code=400, detail="Invalid JSON")
     except Exception as e:
@@ -1,16 +1,18 @@
 # app/api/summarization.py
+import asyncio
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.utils.common import get_db
+from app.utils.common import get_async_db
 from app.db.models import Lecture, Slide, TranscriptionSegment, User
 from app.auth import current_active_user
 from app.services.summarization import SummarizationService
-from app.utils.ocr import extract_text_from_base64_image
-from app.schemas import SummarizeRequest
+from app.utils.ocr import extract_text_from_image_bytes_async
+from app.schemas import SummarizeRequest, SummarizeBatchRequest
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -18,53 +20,97 @@ router = APIRouter()
 # Initialize services
 summarization_service = SummarizationService()
 
+# Most slides a single batch request may summarize
+MAX_BATCH_SLIDES = 50
+
+
+async def _fetch_segment_texts(db: AsyncSession, lecture_id: int, slide_index: int) -> List[str]:
+    """Transcript text of a slide's segments, in order."""
+    result = await db.execute(
+        select(TranscriptionSegment.text).filter(
+            TranscriptionSegment.lecture_id == lecture_id,
+            TranscriptionSegment.slide_index == slide_index
+        ).order_by(TranscriptionSegment.start_time)
+    )
+    return [text for text in result.scalars() if text]
+
+
+async def _fetch_segment_texts_by_slide(db: AsyncSession, lecture_id: int, slide_indices: List[int]) -> Dict[int, List[str]]:
+    """Transcript text of several slides' segments, in order, keyed by slide index."""
+    result = await db.execute(
+        select(TranscriptionSegment.slide_index, TranscriptionSegment.text).filter(
+            TranscriptionSegment.lecture_id == lecture_id,
+            TranscriptionSegment.slide_index.in_(slide_indices)
+        ).order_by(TranscriptionSegment.slide_index, TranscriptionSegment.start_time)
+    )
+    texts: Dict[int, List[str]] = {}
+    for slide_index, text in result:
+        if text:
+            texts.setdefault(slide_index, []).append(text)
+    return texts
+
+
+async def _completed(value):
+    """An awaitable that is already done, for the cached side of a gather."""
+    return value
+
 
 @router.post("/lectures/{lecture_id}/slides/{slide_index}/summarize")
 async def summarize_slide_endpoint(
     lecture_id: int,
     slide_index: int,
     request: SummarizeRequest = SummarizeRequest(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(current_active_user)
 ) -> Dict[str, Optional[str]]:
     """Generates and saves a summary for a specific slide."""
     logger.info(f"Summarize request for L:{lecture_id} S:{slide_index}")
 
-    # Verify user owns the lecture first
-    lecture = db.query(Lecture).filter(Lecture.id == lecture_id, Lecture.user_id == str(current_user.id)).first()
-    if not lecture:
-        raise HTTPException(status_code=404, detail="Lecture not found")
-    
-    slide = db.query(Slide).filter(Slide.lecture_id == lecture_id, Slide.index == slide_index).with_for_update().first()
-    if not slide:
+    # Ownership check, lecture status and the locked slide in one round trip
+    result = await db.execute(
+        select(Slide, Lecture.status).join(Lecture, Slide.lecture_id == Lecture.id).filter(
+            Slide.lecture_id == lecture_id,
+            Slide.index == slide_index,
+            Lecture.user_id == str(current_user.id)
+        ).with_for_update(of=Slide)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Slide not found")
+    slide, lecture_status = row
 
-    lecture_status = lecture.status
     if lecture_status != 'completed':
         raise HTTPException(status_code=400, detail=f"Cannot summarize, lecture status is '{lecture_status}'.")
 
-    segments = db.query(TranscriptionSegment).filter(
-        TranscriptionSegment.lecture_id == lecture_id,
-        TranscriptionSegment.slide_index == slide_index
-    ).order_by(TranscriptionSegment.start_time).all()
+    # OCR (in the OCR worker pool) overlaps the segment query
+    run_ocr = slide.ocr_text is None and slide.image_data
+    segment_texts, ocr_result = await asyncio.gather(
+        _fetch_segment_texts(db, lecture_id, slide_index),
+        extract_text_from_image_bytes_async(slide.image_data) if run_ocr else _completed(slide.ocr_text or ""),
+        return_exceptions=True
+    )
+    if isinstance(segment_texts, BaseException):
+        raise segment_texts
+
+    # Extract slide content using OCR (once per slide; the image never changes)
+    if isinstance(ocr_result, BaseException):
+        logger.warning(f"OCR failed for slide {slide_index}: {ocr_result}")
+        slide_content = ""
+    else:
+        slide_content = ocr_result
+        if run_ocr:
+            slide.ocr_text = slide_content  # Saved with the summary below
+            logger.info(f"Extracted {len(slide_content)} characters from slide {slide_index} using OCR")
 
-    full_slide_text = " ".join([seg.text for seg in segments if seg.text]).strip()
+    full_slide_text = " ".join(segment_texts).strip()
 
     if not full_slide_text:
         logger.warning(f"No text to summarize for L:{lecture_id} S:{slide_index}")
+        if run_ocr:
+            await db.commit()  # Keep the OCR result
         return {"summary": None, "message": "No transcription text available for this slide."}
 
-    # Extract slide content using OCR
-    slide_content = ""
-    try:
-        if slide.image_data:
-            slide_content = extract_text_from_base64_image(slide.image_data)
-            logger.info(f"Extracted {len(slide_content)} characters from slide {slide_index} using OCR")
-    except Exception as ocr_error:
-        logger.warning(f"OCR failed for slide {slide_index}: {ocr_error}")
-        slide_content = ""
-
-    if not summarization_service.llm:
+    if not summarization_service.api_key:
         logger.error("Summarization service unavailable (likely no API key)")
         raise HTTPException(status_code=503, detail="Summarization service is not configured.")
 
@@ -81,12 +127,85 @@ async def summarize_slide_endpoint(
 
         slide.summary = new_summary
         db.add(slide)
-        db.commit()
+        await db.commit()
         logger.info(f"Summary saved for L:{lecture_id} S:{slide_index}")
         return {"summary": new_summary}
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Failed to summarize or save summary for L:{lecture_id} S:{slide_index}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error during summarization process: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error during summarization process: {str(e)}")
+
+
+@router.post("/lectures/{lecture_id}/summarize-batch")
+async def summarize_slides_batch_endpoint(
+    lecture_id: int,
+    request: SummarizeBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(current_active_user)
+) -> Dict[str, Dict[int, Optional[str]]]:
+    """
+    Generates and saves summaries for several slides, batching them into as few
+    LLM calls as possible. Slides with no transcription text map to None.
+    """
+    slide_indices = sorted(set(request.slide_indices))
+    if not slide_indices:
+        raise HTTPException(status_code=400, detail="slide_indices must not be empty.")
+    if len(slide_indices) > MAX_BATCH_SLIDES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SLIDES} slides can be summarized per request.")
+    logger.info(f"Batch summarize request for L:{lecture_id} S:{slide_indices}")
+
+    # Ownership check, lecture status and the locked slides in one round trip
+    result = await db.execute(
+        select(Slide, Lecture.status).join(Lecture, Slide.lecture_id == Lecture.id).filter(
+            Slide.lecture_id == lecture_id,
+            Slide.index.in_(slide_indices),
+            Lecture.user_id == str(current_user.id)
+        ).order_by(Slide.index).with_for_update(of=Slide)
+    )
+    rows = result.all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Slides not found")
+    lecture_status = rows[0][1]
+    if lecture_status != 'completed':
+        raise HTTPException(status_code=400, detail=f"Cannot summarize, lecture status is '{lecture_status}'.")
+    slides = {slide.index: slide for slide, _ in rows}
+
+    if not summarization_service.api_key:
+        logger.error("Summarization service unavailable (likely no API key)")
+        raise HTTPException(status_code=503, detail="Summarization service is not configured.")
+
+    # OCR the slides that have no stored text (OCR worker pool) while the segments are queried
+    needs_ocr = [slide for slide in slides.values() if slide.ocr_text is None and slide.image_data]
+    segment_texts, *ocr_results = await asyncio.gather(
+        _fetch_segment_texts_by_slide(db, lecture_id, list(slides)),
+        *(extract_text_from_image_bytes_async(slide.image_data) for slide in needs_ocr),
+        return_exceptions=True
+    )
+    if isinstance(segment_texts, BaseException):
+        raise segment_texts
+    for slide, ocr_result in zip(needs_ocr, ocr_results):
+        if isinstance(ocr_result, BaseException):
+            logger.warning(f"OCR failed for slide {slide.index}: {ocr_result}")
+        else:
+            slide.ocr_text = ocr_result  # Saved with the summaries below
+
+    batch_input = {}
+    for index, slide in slides.items():
+        full_slide_text = " ".join(segment_texts.get(index, [])).strip()
+        if full_slide_text:
+            batch_input[index] = (full_slide_text, slide.ocr_text or "")
+
+    try:
+        new_summaries = await summarization_service.summarize_slides_batch(batch_input)
+        for index, summary in new_summaries.items():
+            slides[index].summary = summary
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to summarize or save summaries for L:{lecture_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error during summarization process: {str(e)}")
+
+    logger.info(f"Saved {len(new_summaries)} of {len(slides)} summaries for L:{lecture_id}")
+    return {"summaries": {index: new_summaries.get(index) for index in slides}}
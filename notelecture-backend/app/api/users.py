@@ -5,11 +5,28 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from app.core.config import settings
 from app.db.http_client import supabase_http
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 security = HTTPBearer()
 
+# JWT verification inputs, prepared once instead of per request
+_JWT_KEY = settings.SECRET_KEY.encode()
+_JWT_ALGORITHMS = [settings.ALGORITHM]
+# fastapi-users sets neither an audience nor an issuer
+_JWT_OPTIONS = {"verify_aud": False, "verify_iss": False}
+
+# Verified users keyed by id, so authenticated requests skip the Supabase round trip
+USER_CACHE_TTL_SECONDS = 60
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_cached_user(user_id: str) -> None:
+    """Drop a user's cached record (call after changing it)."""
+    _user_cache.pop(str(user_id))
+
+
 async def get_current_user_http(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user using HTTP approach to avoid database connection issues"""
     try:
@@ -17,15 +34,7 @@ async def get_current_user_http(credentials: HTTPAuthorizationCredentials = Depe
         token = credentials.credentials
         
         # Decode without audience validation since fastapi-users doesn't set it
-        payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY, 
-            algorithms=[settings.ALGORITHM],
-            options={
-                "verify_aud": False,  # fastapi-users doesn't use audience
-                "verify_iss": False,  # fastapi-users doesn't use issuer
-            }
-        )
+        payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS, options=_JWT_OPTIONS)
         user_id = payload.get("sub")
         logger.info(f"JWT payload: {payload}")
         logger.info(f"Extracted user_id: {user_id}")
@@ -33,6 +42,10 @@ async def get_current_user_http(credentials: HTTPAuthorizationCredentials = Depe
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
+        user = _user_cache.get(user_id)
+        if user is not None:
+            return user
+
         # Get user via HTTP with better error handling
         logger.info(f"Looking up user with ID: {user_id}")
         user = await supabase_http.get_user_by_id(user_id)
@@ -41,7 +54,8 @@ async def get_current_user_http(credentials: HTTPAuthorizationCredentials = Depe
         if not user:
             logger.error(f"User not found in database for ID: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
-            
+
+        _user_cache.set(user_id, user)
         return user
         
     except jwt.ExpiredSignatureError:
@@ -1,6 +1,6 @@
 # app/core/config.py
 
-import json
+import orjson
 from typing import List
 from pydantic_settings import BaseSettings
 from typing import Any, Dict, Optional
@@ -15,6 +15,7 @@ class Settings(BaseSettings):
     PROJECT_NAME: str
     BACKEND_CORS_ORIGINS: Optional[List[str]] = None
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # Finished async engine URL; derived from DATABASE_URL when unset
     UPLOADS_DIR: str
     
     # Authentication related settings
@@ -49,6 +50,29 @@ class Settings(BaseSettings):
     EXTERNAL_SERVICE_API_KEY: str = ""
     BACKEND_URL: Optional[str] = None  # Main backend URL for callbacks
 
+    # Async database pool
+    DB_POOL_MODE: Optional[str] = None  # "queue", "singleton" or "null" (default: null on Vercel or Neon, else queue)
+    DB_POOL_SIZE: int = 10  # queue mode only
+    DB_MAX_OVERFLOW: int = 5  # queue mode only
+    DB_WARMUP: bool = True  # Open a pooled connection at startup (not in null mode)
+    DB_PREPARED_STATEMENTS: bool = False  # Cache prepared statements (PgBouncer >= 1.22 or a direct connection)
+
+    # Uploads
+    MAX_UPLOAD_BYTES: int = 2 * 1024 * 1024 * 1024  # Largest accepted upload request (2 GB)
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024  # Chunk size when streaming uploads to disk
+
+    # Local processing (used when no external service is configured)
+    BACKGROUND_WORKERS: int = 1  # Worker processes for local video processing
+    PDF_RENDER_WORKERS: int = 0  # Worker processes for local PDF rendering (0 = one per CPU)
+    OCR_WORKERS: int = 0  # Worker processes for slide OCR (0 = one per CPU, at most 4)
+
+    # Rendered presentation cache (keyed by file content hash)
+    PRESENTATION_CACHE_DIR: str = "/tmp/presentation_cache"
+    PRESENTATION_CACHE_TTL_SECONDS: int = 30 * 86400
+    # Total size cap, least recently used entries evicted first; 0 disables the cache
+    # (default: off on Vercel, whose small /tmp also holds uploads and audio, 512 MB elsewhere)
+    PRESENTATION_CACHE_MAX_BYTES: Optional[int] = None
+
     @field_validator('BACKEND_CORS_ORIGINS', mode='before')
     @classmethod
     def parse_cors_origins(cls, v):
@@ -57,8 +81,8 @@ class Settings(BaseSettings):
             return None
         if isinstance(v, str):
             try:
-                return json.loads(v)
-            except json.JSONDecodeError:
+                return orjson.loads(v)
+            except orjson.JSONDecodeError:
                 # If it's a single origin string, return as list
                 return [v]
         return v
@@ -72,4 +96,4 @@ class Settings(BaseSettings):
         env_file_encoding = 'utf-8'  # Encoding of the environment file
 
 # Create a global settings instance for use throughout the application
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -2,49 +2,85 @@
 """
 Database connection setup for both sync and async operations.
 """
+import itertools
+import logging
+import os
+import socket
+import ssl
+from functools import partial
 from typing import AsyncGenerator
-from sqlalchemy import create_engine
+from urllib.parse import urlsplit, urlunsplit
+from uuid import uuid4
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Sync database setup
 engine = create_engine(
     settings.DATABASE_URL,
-    # Disable prepared statements for pgbouncer compatibility
-    execution_options={"compiled_cache": None}
+    # The few remaining sync endpoints share this pool; bounded so bursts can't exhaust PgBouncer
+    pool_size=5,
+    max_overflow=10,
+    pool_recycle=3600,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: objects stay readable after commit (and after the session closes)
+# instead of lazily reloading each attribute. The options never vary, so a bound partial stands in
+# for sessionmaker and skips its per-call kwargs merge; callers still just call SessionLocal()
+SessionLocal = partial(Session, bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
 
 # Async database setup
-# Convert PostgreSQL URL for async usage and handle connection pooling
-if settings.DATABASE_URL.startswith("postgresql://"):
-    async_database_url = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
-    
-    # For Supabase/serverless environments, prefer pooled connections
-    # Convert direct connection (:5432) to pooled connection (:6543)
-    if "supabase.co:5432" in async_database_url:
-        async_database_url = async_database_url.replace(":5432", ":6543")
-        print(f"Using Supabase connection pooler: {async_database_url.split('@')[1]}")
-    elif ".supabase.co/" in async_database_url and ":6543" not in async_database_url:
-        # If it's a Supabase URL without explicit port, add pooler port
-        async_database_url = async_database_url.replace(".supabase.co/", ".supabase.co:6543/")
-        print(f"Using Supabase connection pooler: {async_database_url.split('@')[1]}")
-        
-elif settings.DATABASE_URL.startswith("mysql+pymysql://"):
-    # Fallback for MySQL (legacy support)
-    async_database_url = settings.DATABASE_URL.replace("mysql+pymysql://", "mysql+aiomysql://")
-else:
-    async_database_url = settings.DATABASE_URL
+# Drivers used by the async engine, by DATABASE_URL scheme (MySQL is legacy support)
+ASYNC_DRIVER_SCHEMES = {"postgresql": "postgresql+asyncpg", "mysql+pymysql": "mysql+aiomysql"}
+SUPABASE_POOLER_PORT = 6543
+
+
+def build_async_database_url(database_url: str, disable_statement_cache: bool) -> str:
+    """
+    Derives the async engine URL from DATABASE_URL in one parse: switches to the async driver,
+    points Supabase direct connections (:5432) at the pooler, and adds the pgbouncer flags.
+    """
+    parts = urlsplit(database_url)
+    scheme = ASYNC_DRIVER_SCHEMES.get(parts.scheme, parts.scheme)
+    netloc = parts.netloc
+    hostname = parts.hostname or ""
+    if scheme == "postgresql+asyncpg" and hostname.endswith(".supabase.co") and parts.port in (None, 5432):
+        # For Supabase/serverless environments, prefer pooled connections
+        userinfo, _, _ = netloc.rpartition("@")
+        netloc = f"{userinfo}@{hostname}:{SUPABASE_POOLER_PORT}" if userinfo else f"{hostname}:{SUPABASE_POOLER_PORT}"
+    query = parts.query
+    if disable_statement_cache:
+        # Disables prepared statements at the connection level
+        query = "&".join(filter(None, [query, "prepared_statement_cache_size=0&statement_cache_size=0"]))
+    return urlunsplit((scheme, netloc, parts.path, query, parts.fragment))
+
+
+# A deploy can set ASYNC_DATABASE_URL to the finished URL and skip the derivation
+async_database_url = settings.ASYNC_DATABASE_URL or build_async_database_url(
+    settings.DATABASE_URL, disable_statement_cache=not settings.DB_PREPARED_STATEMENTS
+)
+# Parsed once here; the checks below compare the host and port rather than scanning the whole URL
+# (where the password or a query parameter could contain "supabase.co" or ":6543")
+async_database_parts = urlsplit(async_database_url)
+async_database_host = async_database_parts.hostname or ""
+if async_database_parts.port == SUPABASE_POOLER_PORT:
+    logger.info(f"Using Supabase connection pooler: {async_database_host}")
 
 # Configure asyncpg for serverless environments like Vercel
-import os
-from uuid import uuid4
 
-# Generate unique prepared statement names for pgbouncer compatibility
+# SQLAlchemy's asyncpg dialect still prepares named statements. Behind pgbouncer a server connection
+# is shared with other processes, so names must be unique across processes: a random per-process
+# prefix plus a counter (next() on itertools.count is atomic under the GIL; no urandom per statement)
+_prepared_statement_prefix = f"__asyncpg_{uuid4().hex[:8]}_"
+_prepared_statement_ids = itertools.count()
+
 def generate_unique_prepared_statement_name():
     """Generate unique prepared statement names to avoid conflicts with pgbouncer."""
-    return f"__asyncpg_{uuid4().hex[:8]}__"
+    return f"{_prepared_statement_prefix}{next(_prepared_statement_ids)}__"
 
 connect_args = {
     "server_settings": {
@@ -53,94 +89,180 @@ connect_args = {
     },
     "command_timeout": 30,  # Allow enough time for connection cleanup
     "timeout": 30,  # Connection timeout
-    "statement_cache_size": 0,  # CRITICAL: Disable prepared statements completely
-    "prepared_statement_cache_size": 0,  # Disable prepared statement cache
-    "prepared_statement_name_func": generate_unique_prepared_statement_name,  # Use UUID-based names
+    "prepared_statement_name_func": generate_unique_prepared_statement_name,  # Unique per process and statement
 }
 
-# Add SSL configuration for production
-if "supabase.co" in async_database_url or os.getenv("VERCEL"):
-    connect_args["ssl"] = "require"
+# PgBouncer before 1.22 can't track prepared statements in transaction mode, so statement caching
+# is disabled by default. With PgBouncer >= 1.22 (max_prepared_statements > 0) or a direct connection,
+# DB_PREPARED_STATEMENTS=true keeps asyncpg's caches so hot queries are parsed and planned once.
+if not settings.DB_PREPARED_STATEMENTS:
+    connect_args["statement_cache_size"] = 0  # Disable prepared statements completely
+    connect_args["prepared_statement_cache_size"] = 0  # Disable prepared statement cache
 
-# Add connection pooling configuration optimized for serverless
-from sqlalchemy.pool import NullPool
+# Add SSL configuration for production
+if async_database_host.endswith(".supabase.co") or os.getenv("VERCEL"):
+    # Same semantics as ssl="require" (encrypt, don't verify the certificate), but built once here:
+    # asyncpg would otherwise create a new SSLContext for every connection, i.e. every request under NullPool
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    connect_args["ssl"] = ssl_context
 
-# CRITICAL: Add pgbouncer compatibility parameters to the URL
-# This disables prepared statements at the connection level
-if "?" in async_database_url:
-    async_database_url += "&prepared_statement_cache_size=0&statement_cache_size=0"
+# Pool policy (DB_POOL_MODE):
+#   queue     - long-lived processes keep a small pool and skip the TCP + TLS + auth handshake per request
+#   singleton - one kept-alive connection, for warm serverless instances that serve one request at a time
+#   null      - connect per checkout; the default on Vercel, whose runtime may run invocations on
+#               different event loops (an asyncpg connection can't be reused across loops), and for
+#               scale-to-zero databases, where idle pooled connections would keep the compute awake
+SCALE_TO_ZERO_HOST_SUFFIXES = (".neon.tech",)
+scale_to_zero_database = async_database_host.endswith(SCALE_TO_ZERO_HOST_SUFFIXES)
+pool_mode = settings.DB_POOL_MODE or ("null" if os.getenv("VERCEL") or scale_to_zero_database else "queue")
+if pool_mode == "null":
+    async_pool_args = {"poolclass": NullPool}
+elif pool_mode == "singleton":
+    async_pool_args = {"pool_size": 1, "max_overflow": 0, "pool_timeout": 30, "pool_recycle": 60}
+elif pool_mode == "queue":
+    async_pool_args = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": 30,
+        "pool_recycle": 60,  # Stay below PgBouncer's idle timeouts
+    }
 else:
-    async_database_url += "?prepared_statement_cache_size=0&statement_cache_size=0"
+    raise ValueError(f"Unknown DB_POOL_MODE {pool_mode!r}; expected 'null', 'queue' or 'singleton'")
+logger.info(f"Async database pool mode: {pool_mode}")
 
 async_engine = create_async_engine(
     async_database_url,
     connect_args=connect_args,
-    poolclass=NullPool,  # Use NullPool for serverless environments
-    pool_recycle=300,  # Recycle connections every 5 minutes
+    **async_pool_args,
     pool_pre_ping=False,  # CRITICAL: Disable pre-ping to avoid prepared statements
     echo=False,
-    # NUCLEAR OPTION: Force all statements to execute as plain text
     execution_options={
-        "compiled_cache": None,  # Disable compiled cache
         "render_postcompile": True,  # Force inline parameter rendering
         "autocommit": False,  # Use explicit transaction control
     },
     future=True
 )
 
-AsyncSessionLocal = sessionmaker(
-    async_engine,
-    class_=AsyncSession,
+# TCP keepalive probes on pooled connections, so proxies in front of Postgres don't silently drop
+# a connection that sits idle between requests (the next checkout would then fail and reconnect)
+TCP_KEEPALIVE_OPTIONS = (
+    ("TCP_KEEPIDLE", 30),
+    ("TCP_KEEPINTVL", 10),
+    ("TCP_KEEPCNT", 3),
+)
+
+
+def _enable_tcp_keepalive(dbapi_connection, connection_record) -> None:
+    """Turns on SO_KEEPALIVE (with Linux tuning where available) on a new asyncpg connection's socket."""
+    transport = getattr(dbapi_connection.driver_connection, "_transport", None)
+    sock = transport.get_extra_info("socket") if transport else None
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in TCP_KEEPALIVE_OPTIONS:
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    except OSError as e:
+        logger.warning(f"Could not enable TCP keepalive on database connection: {e}")
+
+
+# Under NullPool a connection never outlives its request, so there's nothing to keep alive
+if pool_mode != "null":
+    event.listen(async_engine.sync_engine, "connect", _enable_tcp_keepalive)
+
+AsyncSessionLocal = partial(
+    AsyncSession,
+    bind=async_engine,
     expire_on_commit=False,
     autoflush=False,  # Prevent automatic flushes
-    autocommit=False  # Ensure explicit commits
+)
+
+# Read-only requests run in AUTOCOMMIT: no BEGIN before the first query and no ROLLBACK when the
+# session closes, i.e. two fewer round-trips to the database per request. Shares async_engine's pool.
+read_only_async_engine = async_engine.execution_options(isolation_level="AUTOCOMMIT")
+AsyncReadSessionLocal = partial(
+    AsyncSession,
+    bind=read_only_async_engine,
+    expire_on_commit=False,
+    autoflush=False,
 )
 
 
-def get_session():
-    """Get sync database session."""
-    db = SessionLocal()
+async def warm_up_async_engine() -> None:
+    """
+    Opens a pooled connection at startup so the first request doesn't pay the TCP + TLS + auth
+    handshake. Skipped in null pool mode, where the connection would be closed straight away.
+    """
+    if pool_mode == "null" or not settings.DB_WARMUP:
+        return
     try:
-        yield db
-    finally:
-        db.close()
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        logger.info("Database connection pool warmed up")
+    except Exception as e:
+        logger.warning(f"Database warm-up failed; the first request will connect instead: {e}")
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     """Get async database session with proper isolation for serverless and pgbouncer compatibility."""
     session = None
     try:
-        # Create a fresh sessionmaker for each request to avoid event loop binding issues
-        # This prevents the "bound to different event loop" error in serverless environments
-        fresh_sessionmaker = sessionmaker(
-            async_engine,
-            class_=AsyncSession,
-            expire_on_commit=False,
-            autoflush=False,
-            autocommit=False
-        )
-        session = fresh_sessionmaker()
-
-        # For debugging: log connection info
-        print(f"Created new async session for request")
+        # The session factory holds no connections, so sharing it across event loops is safe; on Vercel
+        # the engine uses NullPool, so no pooled connection outlives the loop that opened it
+        session = AsyncSessionLocal()
+
+        logger.debug("Created new async session for request")
 
         yield session
+    except DBAPIError as e:
+        # pool_pre_ping stays off (its SELECT 1 pins PgBouncer backends), so a connection the server
+        # or a proxy dropped is only found when a query fails. SQLAlchemy has already invalidated it
+        # and the pool's older connections; discard it rather than roll back over a dead socket.
+        # The request isn't retried: the handler may already have had side effects.
+        if e.connection_invalidated and session:
+            logger.warning(f"Database connection was lost; discarding it: {e}")
+            try:
+                await session.invalidate()
+            except Exception as invalidate_error:
+                logger.exception(f"Error invalidating session: {invalidate_error}")
+        elif session:
+            try:
+                await session.rollback()
+            except Exception as rollback_error:
+                logger.exception(f"Error during rollback: {rollback_error}")
+        raise
     except Exception as e:
-        print(f"Session error occurred: {type(e).__name__}: {e}")
+        logger.debug(f"Session error occurred: {type(e).__name__}: {e}")
         if session:
             try:
                 await session.rollback()  # Rollback on error
             except Exception as rollback_error:
-                print(f"Error during rollback: {rollback_error}")
+                logger.exception(f"Error during rollback: {rollback_error}")
         raise e
     finally:
         if session:
             try:
-                # Close session with timeout protection
-                import asyncio
-                await asyncio.wait_for(session.close(), timeout=10.0)
-                print(f"Successfully closed async session")
-            except asyncio.TimeoutError:
-                print(f"Session close timed out - ignoring (connection will be cleaned up by pool)")
+                # Closing just returns the connection to the pool (or drops it under NullPool), so
+                # it's awaited directly rather than through wait_for's per-request timer
+                await session.close()
+                logger.debug("Successfully closed async session")
             except Exception as close_error:
-                print(f"Error closing session: {close_error}")  # Log but don't raise
\ No newline at end of file
+                logger.exception(f"Error closing session: {close_error}")  # Log but don't raise
+
+
+async def get_async_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Get an AUTOCOMMIT async session for endpoints that only read. Nothing it runs is transactional,
+    so never write through it; nor stream() with it, since asyncpg cursors need a transaction.
+    """
+    session = AsyncReadSessionLocal()
+    try:
+        yield session
+    finally:
+        try:
+            await session.close()
+        except Exception as close_error:
+            logger.exception(f"Error closing read-only session: {close_error}")  # Log but don't raise
@@ -2,13 +2,12 @@
 """
 HTTP-based database client using Supabase REST API to bypass network connection issues in Vercel
 """
-import json
 import uuid
 import hashlib
-import urllib.request
 import urllib.parse
-import urllib.error
+import orjson
 from typing import Optional, Dict, Any
+import httpx
 from app.core.config import settings
 
 class SupabaseHTTPClient:
@@ -18,44 +17,46 @@ class SupabaseHTTPClient:
         
         # Get service role key from settings if available
         self.service_key = getattr(settings, 'supabase_service_key', None)
-        
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, use_service_key: bool = False) -> Dict[Any, Any]:
-        """Make HTTP request to Supabase REST API"""
-        url = f"{self.base_url}/rest/v1/{endpoint}"
-        
-        # Use service key for admin operations, anon key otherwise
-        api_key = self.service_key if (use_service_key and self.service_key) else self.anon_key
-        
-        headers = {
+
+        # Headers per key, built once; service key for admin operations, anon key otherwise
+        self._anon_headers = self._auth_headers(self.anon_key)
+        self._service_headers = self._auth_headers(self.service_key) if self.service_key else self._anon_headers
+
+        # Pooled keep-alive connections, and async so a Supabase call doesn't block the event loop
+        self._http = httpx.AsyncClient(
+            base_url=f"{self.base_url}/rest/v1/",
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+
+    @staticmethod
+    def _auth_headers(api_key: str) -> Dict[str, str]:
+        """Request headers authenticating with the given API key"""
+        return {
             "apikey": api_key,
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "Prefer": "return=representation"
         }
         
-        # Prepare request data
-        request_data = None
-        if data:
-            request_data = json.dumps(data).encode('utf-8')
-        
-        # Create request
-        req = urllib.request.Request(url, data=request_data, headers=headers, method=method)
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, use_service_key: bool = False) -> Dict[Any, Any]:
+        """Make HTTP request to Supabase REST API"""
+        headers = self._service_headers if use_service_key else self._anon_headers
+        request_data = orjson.dumps(data) if data else None
         
         try:
-            with urllib.request.urlopen(req, timeout=30) as response:
-                response_data = response.read().decode('utf-8')
-                return json.loads(response_data) if response_data else {}
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8')
-            raise Exception(f"HTTP {e.code}: {error_body}")
+            response = await self._http.request(method, endpoint, content=request_data, headers=headers)
         except Exception as e:
             raise Exception(f"Request failed: {str(e)}")
+        if response.is_error:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        return orjson.loads(response.content) if response.content else {}
     
     async def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get user by email address"""
         try:
             endpoint = f"users?email=eq.{urllib.parse.quote(email)}&select=*"
-            result = self._make_request("GET", endpoint)
+            result = await self._make_request("GET", endpoint)
             return result[0] if result else None
         except Exception as e:
             print(f"Error getting user by email: {e}")
@@ -66,7 +67,7 @@ class SupabaseHTTPClient:
         try:
             endpoint = f"users?id=eq.{user_id}&select=*"
             print(f"Making request to: {endpoint}")
-            result = self._make_request("GET", endpoint)
+            result = await self._make_request("GET", endpoint)
             print(f"HTTP result for user ID {user_id}: {result}")
             return result[0] if result else None
         except Exception as e:
@@ -80,7 +81,7 @@ class SupabaseHTTPClient:
             endpoint = f"rpc/create_oauth_user"
             data = {"user_email": email}
             
-            result = self._make_request("POST", endpoint, data, use_service_key=False)
+            result = await self._make_request("POST", endpoint, data, use_service_key=False)
             return result
                     
         except Exception as e:
@@ -94,10 +95,14 @@ class SupabaseHTTPClient:
         """Test the HTTP connection to Supabase"""
         try:
             # Simple test query
-            result = self._make_request("GET", "users?limit=1&select=count")
+            result = await self._make_request("GET", "users?limit=1&select=count")
             return {"status": "connected", "result": result}
         except Exception as e:
             return {"status": "error", "error": str(e)}
 
+    async def close(self) -> None:
+        """Closes the pooled connections. Called on application shutdown."""
+        await self._http.aclose()
+
 # Global instance
 supabase_http = SupabaseHTTPClient()
\ No newline at end of file
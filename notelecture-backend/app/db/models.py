@@ -1,10 +1,12 @@
 # app/db/models.py
 from typing import Any
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime, Boolean, Numeric, UniqueConstraint, LargeBinary, Index
+from sqlalchemy import text
 from sqlalchemy.orm import relationship, DeclarativeBase
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
+from app.utils.images import to_data_url
 from datetime import datetime, timedelta
 
 
@@ -19,6 +21,7 @@ class User(SQLAlchemyBaseUserTableUUID, Base):
     last_name = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     free_lectures_used = Column(Integer, default=0)
+    total_lectures_ever = Column(Integer, default=0, nullable=False, server_default="0")  # Maintained on lecture create/delete
     
     # Relationships
     lectures = relationship("Lecture", back_populates="user", cascade="all, delete-orphan")
@@ -34,6 +37,10 @@ class User(SQLAlchemyBaseUserTableUUID, Base):
 
 class Lecture(Base):
     __tablename__ = "lectures"
+    __table_args__ = (
+        # Serves the per-user lecture list (WHERE user_id = ? ORDER BY id DESC)
+        Index("ix_lectures_user_id_id", "user_id", text("id DESC")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255))
@@ -45,30 +52,46 @@ class Lecture(Base):
     transcription_segments = relationship(
         "TranscriptionSegment",
         back_populates="lecture",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        order_by="TranscriptionSegment.start_time"
     )
     slides = relationship(
         "Slide",
         back_populates="lecture",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        order_by="Slide.index"
     )
     user = relationship("User", back_populates="lectures")
 
 class Slide(Base):
     __tablename__ = "slides"
+    __table_args__ = (
+        Index("ix_slides_lecture_id_index", "lecture_id", "index"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     lecture_id = Column(Integer, ForeignKey("lectures.id"), nullable=False)
     index = Column(Integer, nullable=False)
-    image_data = Column(Text) # PostgreSQL TEXT can handle large data
+    image_data = Column(LargeBinary) # Raw image bytes (bytea); base64 only at the API boundary
+    image_mime = Column(String(32), nullable=True) # e.g. image/webp
 
 
     summary = Column(Text, nullable=True)
+    ocr_text = Column(Text, nullable=True) # OCR of image_data, filled on first use ("" = no text found)
 
     lecture = relationship("Lecture", back_populates="slides")
 
+    @property
+    def image_url(self) -> str | None:
+        """The slide image as a data URL, for JSON responses."""
+        return to_data_url(self.image_mime, self.image_data)
+
 class TranscriptionSegment(Base):
     __tablename__ = "transcription_segments"
+    __table_args__ = (
+        # Conflict target for segment upserts
+        UniqueConstraint("lecture_id", "start_time", name="uq_transcription_segments_lecture_start"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     lecture_id = Column(Integer, ForeignKey("lectures.id"), nullable=False)
@@ -96,6 +119,10 @@ class SubscriptionPlan(Base):
 
 class UserSubscription(Base):
     __tablename__ = "user_subscriptions"
+    __table_args__ = (
+        # Partial index for the active-subscription lookup (user_id, is_active, end_date >= now)
+        Index("ix_user_sub_active", "user_id", "end_date", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
@@ -110,15 +137,16 @@ class UserSubscription(Base):
     user = relationship("User", back_populates="subscriptions")
     plan = relationship("SubscriptionPlan", back_populates="subscriptions")
     
-    def is_expired(self):
+    def is_expired(self, now=None):
         """Check if subscription is expired"""
-        return datetime.utcnow() > self.end_date
+        return (now or datetime.utcnow()) > self.end_date
     
-    def days_remaining(self):
+    def days_remaining(self, now=None):
         """Get days remaining in subscription"""
-        if self.is_expired():
+        now = now or datetime.utcnow()
+        if self.is_expired(now):
             return 0
-        return (self.end_date - datetime.utcnow()).days
+        return (self.end_date - now).days
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -3,6 +3,7 @@ import logging
 import logging.config # Keep this if you plan advanced config later
 import os
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles # Keep if needed
 
@@ -11,6 +12,12 @@ from app.api import oauth
 from app.core.config import settings
 from app.auth import fastapi_users, auth_backend, google_oauth_client
 from app.schemas import UserRead, UserCreate, UserUpdate
+from app.services.registry import get_transcription_service
+from app.api.background_tasks import shutdown_process_pool, close_external_http_client
+from app.services.presentation import shutdown_render_pool
+from app.utils.ocr import shutdown_ocr_pool
+from app.db.connection import warm_up_async_engine
+from app.db.http_client import supabase_http
 
 
 # --- Basic Logging Configuration ---
@@ -27,7 +34,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- FastAPI App Initialization ---
-app = FastAPI(title=settings.PROJECT_NAME)
+# orjson is much faster than the stdlib encoder for the large transcription payloads
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=ORJSONResponse)
 logger.info(f"Configured logging. Starting {settings.PROJECT_NAME} application...") # Test log
 
 # --- Add middleware to handle database errors ---
@@ -146,3 +154,22 @@ app.include_router(
 # --- Include API Routers ---
 app.include_router(api.router, prefix="/api")
 logger.info("API router included at prefix /api")
+
+
+# --- Shared Service Lifecycle ---
+@app.on_event("startup")
+async def init_shared_services():
+    # Build the shared transcription client up front instead of on the first request
+    get_transcription_service()
+    await warm_up_async_engine()
+
+
+@app.on_event("shutdown")
+async def close_shared_services():
+    await get_transcription_service().close_client()
+    shutdown_process_pool()
+    shutdown_render_pool()
+    shutdown_ocr_pool()
+    await oauth.close_http_client()
+    await close_external_http_client()
+    await supabase_http.close()
@@ -1,6 +1,6 @@
 # app/schemas.py
 import uuid
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from fastapi_users import schemas
 from pydantic import BaseModel
@@ -27,6 +27,61 @@ class SummarizeRequest(BaseModel):
     custom_prompt: Optional[str] = None
 
 
+class SummarizeBatchRequest(BaseModel):
+    slide_indices: List[int]
+
+
 class UpdateLectureRequest(BaseModel):
     title: Optional[str] = None
-    notes: Optional[str] = None
\ No newline at end of file
+    notes: Optional[str] = None
+
+# Subscription Response Models
+class SubscriptionPlanResponse(BaseModel):
+    id: int
+    name: str
+    duration_days: int
+    price: float
+    lecture_limit: int
+    description: str
+
+
+class SubscriptionPlansResponse(BaseModel):
+    plans: List[SubscriptionPlanResponse]
+
+
+class SubscriptionStatusResponse(BaseModel):
+    """Subscribers get the plan fields, free users the free_* fields."""
+    has_subscription: bool
+    plan_name: Optional[str] = None
+    plan_id: Optional[int] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    lectures_used: Optional[int] = None
+    lectures_limit: Optional[int] = None
+    lectures_remaining: Optional[int] = None
+    days_remaining: Optional[int] = None
+    is_expired: Optional[bool] = None
+    free_lectures_used: Optional[int] = None
+    free_lectures_remaining: Optional[int] = None
+    free_lectures_limit: Optional[int] = None
+
+
+class UsageStatsResponse(BaseModel):
+    """Premium users get the plan fields, free users the free_* fields."""
+    subscription_type: str
+    total_lectures_ever: int
+    plan_name: Optional[str] = None
+    lectures_used_this_period: Optional[int] = None
+    lectures_limit: Optional[int] = None
+    lectures_remaining: Optional[int] = None
+    days_remaining: Optional[int] = None
+    subscription_end: Optional[datetime] = None
+    free_lectures_used: Optional[int] = None
+    free_lectures_remaining: Optional[int] = None
+    needs_upgrade: Optional[bool] = None
+
+
+class CancelSubscriptionResponse(BaseModel):
+    message: str
+    cancelled_plan: str
+    access_until: datetime
@@ -1,27 +1,38 @@
 # app/services/paypal.py
 import logging
 from typing import Dict, Any, Optional
-import paypalrestsdk
 from datetime import datetime
 
 from app.core.config import settings
 from app.db.models import Payment, UserSubscription, SubscriptionPlan, User
-from app.utils.common import get_db_sync
+from app.db.connection import SessionLocal
 
 logger = logging.getLogger(__name__)
 
 class PayPalService:
     def __init__(self):
+        self._sdk = None
         if settings.PAYPAL_CLIENT_ID and settings.PAYPAL_CLIENT_SECRET:
+            self.configured = True
+        else:
+            logger.warning("PayPal credentials not configured. PayPal functionality will be disabled.")
+            self.configured = False
+
+    @property
+    def sdk(self):
+        """
+        paypalrestsdk, imported and configured on first use. Most requests never touch
+        PayPal, so cold starts skip loading the SDK and its HTTP stack.
+        """
+        if self._sdk is None:
+            import paypalrestsdk
             paypalrestsdk.configure({
                 "mode": settings.PAYPAL_MODE,  # sandbox or live
                 "client_id": settings.PAYPAL_CLIENT_ID,
                 "client_secret": settings.PAYPAL_CLIENT_SECRET
             })
-            self.configured = True
-        else:
-            logger.warning("PayPal credentials not configured. PayPal functionality will be disabled.")
-            self.configured = False
+            self._sdk = paypalrestsdk
+        return self._sdk
     
     def create_payment_order(
         self, 
@@ -38,7 +49,7 @@ class PayPalService:
             }
         
         try:
-            payment = paypalrestsdk.Payment({
+            payment = self.sdk.Payment({
                 "intent": "sale",
                 "payer": {
                     "payment_method": "paypal"
@@ -70,7 +81,7 @@ class PayPalService:
                 logger.info(f"PayPal payment created successfully: {payment.id}")
                 
                 # Store payment record in database
-                db = next(get_db_sync())
+                db = SessionLocal()
                 try:
                     payment_record = Payment(
                         user_id=str(user.id),
@@ -122,13 +133,13 @@ class PayPalService:
             }
         
         try:
-            payment = paypalrestsdk.Payment.find(payment_id)
+            payment = self.sdk.Payment.find(payment_id)
             
             if payment.execute({"payer_id": payer_id}):
                 logger.info(f"PayPal payment executed successfully: {payment_id}")
                 
                 # Update payment record in database
-                db = next(get_db_sync())
+                db = SessionLocal()
                 try:
                     payment_record = db.query(Payment).filter(
                         Payment.paypal_order_id == payment_id
@@ -179,7 +190,7 @@ class PayPalService:
     def get_payment_status(self, payment_id: str) -> Optional[str]:
         """Get the status of a PayPal payment."""
         try:
-            payment = paypalrestsdk.Payment.find(payment_id)
+            payment = self.sdk.Payment.find(payment_id)
             return payment.state if payment else None
         except Exception as e:
             logger.error(f"Error getting PayPal payment status: {e}", exc_info=True)
@@ -191,7 +202,8 @@ class PayPalService:
         # using PayPal's webhook verification API
         # For now, we'll do basic validation
         try:
-            return 'PAYPAL-TRANSMISSION-ID' in headers
+            # Header names arrive lowercased from the ASGI server
+            return any(key.lower() == 'paypal-transmission-id' for key in headers)
         except Exception as e:
             logger.error(f"Error verifying webhook: {e}", exc_info=True)
             return False
@@ -217,7 +229,7 @@ class PayPalService:
             if not payment_id:
                 return False
             
-            db = next(get_db_sync())
+            db = SessionLocal()
             try:
                 payment_record = db.query(Payment).filter(
                     Payment.paypal_order_id == payment_id
@@ -243,7 +255,7 @@ class PayPalService:
             if not payment_id:
                 return False
             
-            db = next(get_db_sync())
+            db = SessionLocal()
             try:
                 payment_record = db.query(Payment).filter(
                     Payment.paypal_order_id == payment_id
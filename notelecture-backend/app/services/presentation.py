@@ -2,11 +2,17 @@
 
 # app/services/presentation.py
 import io
+import os
+import time
 import base64
+import hashlib
 import logging
 import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import httpx
-from typing import List, Dict
+import orjson
+from typing import List, Dict, Optional
 from app.core.config import settings
 
 # Check if PyMuPDF is available
@@ -18,60 +24,223 @@ except ImportError:
     fitz = None
     logging.warning("PyMuPDF not available - will use external service for PDF processing")
 
+# Check if Pillow is available (used to re-encode slides as WebP)
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    Image = None
+    logging.warning("Pillow not available - slide images will be stored as PNG")
+
 logger = logging.getLogger(__name__)
 
+# Slides are mostly flat regions and text; WebP keeps them sharp at a fraction of the PNG size
+SLIDE_IMAGE_FORMAT = "WEBP"
+SLIDE_IMAGE_QUALITY = 85
+
+# Pages are rendered in worker processes so rasterizing and encoding use every core
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _render_worker_count() -> int:
+    return settings.PDF_RENDER_WORKERS or os.cpu_count() or 1
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        workers = _render_worker_count()
+        _render_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Started PDF render pool with {workers} worker(s)")
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def _encode_image(image) -> str:
+    """Encodes a PIL image as a WebP data URL."""
+    buffer = io.BytesIO()
+    image.save(buffer, SLIDE_IMAGE_FORMAT, quality=SLIDE_IMAGE_QUALITY, method=6)
+    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return f"data:image/webp;base64,{base64_image}"
+
+
+def _count_pdf_pages(file_content: bytes) -> int:
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        return pdf_document.page_count
+
+
+def _render_pdf_pages(file_content: bytes, start: int, stop: int) -> List[str]:
+    """Worker entry point: renders pages [start, stop) as data URLs."""
+    image_data_list = []
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        for page_number in range(start, stop):
+            page = pdf_document[page_number]
+            # Render page to pixmap (potentially CPU intensive)
+            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2)) # 2x zoom for quality
+            if PIL_AVAILABLE:
+                # Encode straight from the raw pixels to WebP
+                img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                image_data_list.append(_encode_image(img))
+            else:
+                # Convert to PNG in memory
+                base64_image = base64.b64encode(pix.tobytes("png")).decode('utf-8')
+                image_data_list.append(f"data:image/png;base64,{base64_image}")
+    return image_data_list
+
 class PresentationService:
+    def __init__(self):
+        self.cache_dir = settings.PRESENTATION_CACHE_DIR
+        self.cache_ttl_seconds = settings.PRESENTATION_CACHE_TTL_SECONDS
+        self.cache_max_bytes = settings.PRESENTATION_CACHE_MAX_BYTES
+        if self.cache_max_bytes is None:
+            self.cache_max_bytes = 0 if os.getenv("VERCEL") else 512 * 1024 * 1024
+
     async def process_presentation(self, file_content: bytes, file_extension: str) -> List[str]:
         try:
             if file_extension.lower() in ['ppt', 'pptx']:
                 # return await self._process_powerpoint(file_content) # Needs implementation
                 logger.warning(f"PPT/PPTX processing not yet implemented for file extension: {file_extension}")
                 raise NotImplementedError("PowerPoint processing is not yet supported.")
-            elif file_extension.lower() == 'pdf':
-                return await self._process_pdf(file_content)
-            else:
+            elif file_extension.lower() != 'pdf':
                 raise ValueError(f"Unsupported file type: {file_extension}")
+
+            if not self.cache_max_bytes:
+                return await self._process_pdf(file_content)
+
+            # Re-uploads of the same deck reuse the previous render
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(None, self._sync_content_digest, file_content)
+            cached = await loop.run_in_executor(None, self._sync_cache_get, digest)
+            if cached is not None:
+                logger.info(f"Presentation cache hit ({digest[:12]}): {len(cached)} slides")
+                return cached
+
+            slide_images = await self._process_pdf(file_content)
+            await loop.run_in_executor(None, self._sync_cache_set, digest, slide_images)
+            return slide_images
         except Exception as e:
             logger.error(f"Error processing presentation: {str(e)}")
             raise
 
-    # --- Synchronous Helper for _process_pdf ---
-    def _sync_process_pdf(self, file_content: bytes) -> List[str]:
-        """Synchronous part of PDF processing."""
-        image_data_list = []
+    # --- Synchronous Helpers for the render cache ---
+    def _sync_content_digest(self, file_content: bytes) -> str:
+        return hashlib.blake2b(file_content, digest_size=32).hexdigest()
+
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _sync_cache_get(self, digest: str) -> Optional[List[str]]:
+        path = self._cache_path(digest)
         try:
-            # Create a memory buffer for the PDF
-            memory_buffer = io.BytesIO(file_content)
-            pdf_document = fitz.open(stream=memory_buffer, filetype="pdf")
-
-            for page_number in range(pdf_document.page_count):
-                page = pdf_document[page_number]
-                # Render page to pixmap (potentially CPU intensive)
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2)) # 2x zoom for quality
-                # Convert to PNG in memory
-                img_bytes = pix.tobytes("png")
-                # Encode to base64
-                base64_image = base64.b64encode(img_bytes).decode('utf-8')
-                image_data_list.append(f"data:image/png;base64,{base64_image}")
+            if time.time() - os.path.getmtime(path) > self.cache_ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                slide_images = orjson.loads(f.read())
+            os.utime(path)  # Marks the entry recently used for eviction (and restarts its TTL)
+            return slide_images
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[Sync] Ignoring unreadable presentation cache entry {path}: {e}")
+            return None
+
+    def _sync_cache_set(self, digest: str, slide_images: List[str]) -> None:
+        if not slide_images:
+            return
+        path = self._cache_path(digest)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(slide_images))
+            os.replace(tmp_path, path)  # Atomic, so readers never see a partial entry
+        except Exception as e:
+            logger.warning(f"[Sync] Could not write presentation cache entry {path}: {e}")
+            return
+        self._sync_cache_evict()
+
+    def _sync_cache_evict(self) -> None:
+        """Removes least recently used entries until the cache fits in cache_max_bytes."""
+        entries = []
+        total_bytes = 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total_bytes += stat.st_size
+        except OSError as e:
+            logger.warning(f"[Sync] Could not scan presentation cache {self.cache_dir}: {e}")
+            return
+
+        entries.sort()  # Oldest mtime (least recently used) first
+        for _, size, path in entries:
+            if total_bytes <= self.cache_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except FileNotFoundError:
+                total_bytes -= size  # Another worker evicted it already
+            except OSError as e:
+                logger.warning(f"[Sync] Could not evict presentation cache entry {path}: {e}")
 
-            pdf_document.close()
-            memory_buffer.close()
-            logger.info(f"[Sync] Processed {len(image_data_list)} PDF pages into images.")
+    # --- Synchronous Helpers for slide image encoding ---
+    def _sync_compress_slides(self, image_data_list: List[str]) -> List[str]:
+        """Re-encodes base64 slide images (e.g. PNG from the external service) as WebP."""
+        if not PIL_AVAILABLE:
             return image_data_list
+        compressed = []
+        for i, image_data in enumerate(image_data_list):
+            if image_data.startswith("data:image/webp"):
+                compressed.append(image_data)
+                continue
+            try:
+                image_bytes = base64.b64decode(image_data.split(',')[-1])
+                with Image.open(io.BytesIO(image_bytes)) as img:
+                    compressed.append(_encode_image(img))
+            except Exception as e:
+                logger.warning(f"[Sync] Could not re-encode slide {i} as WebP, keeping original: {e}")
+                compressed.append(image_data)
+        return compressed
 
-        except Exception as e:
-             logger.error(f"[Sync] Error during PDF processing: {e}", exc_info=True)
-             # Ensure resources are closed even on error
-             if 'pdf_document' in locals() and pdf_document: pdf_document.close()
-             if 'memory_buffer' in locals() and memory_buffer: memory_buffer.close()
-             raise # Re-raise
+    async def _render_pdf_locally(self, file_content: bytes) -> List[str]:
+        """Renders the PDF with PyMuPDF, splitting the pages across the render pool."""
+        loop = asyncio.get_running_loop()
+        pool = _get_render_pool()
+        page_count = await loop.run_in_executor(None, _count_pdf_pages, file_content)
+        if not page_count:
+            return []
+
+        chunk_size = -(-page_count // _render_worker_count())
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(pool, _render_pdf_pages, file_content, start, min(start + chunk_size, page_count))
+            for start in range(0, page_count, chunk_size)
+        ))
+        image_data_list = [image for chunk in chunks for image in chunk]
+        logger.info(f"Processed {len(image_data_list)} PDF pages into images.")
+        return image_data_list
 
     async def _process_pdf(self, file_content: bytes) -> List[str]:
         """Convert PDF pages to base64 encoded images (using external service if PyMuPDF not available)."""
         # Try external service first if PyMuPDF is not available or external service is configured
         if not FITZ_AVAILABLE or settings.EXTERNAL_SERVICE_URL:
             try:
-                return await self._process_pdf_external(file_content)
+                slides_images = await self._process_pdf_external(file_content)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, self._sync_compress_slides, slides_images)
             except Exception as e:
                 logger.warning(f"External PDF processing failed: {e}")
                 if not FITZ_AVAILABLE:
@@ -79,11 +248,8 @@ class PresentationService:
         
         # Fallback to local processing if PyMuPDF is available
         if FITZ_AVAILABLE:
-            loop = asyncio.get_running_loop()
             try:
-                # Run the potentially blocking PDF processing in a thread pool executor
-                image_data = await loop.run_in_executor(None, self._sync_process_pdf, file_content)
-                return image_data
+                return await self._render_pdf_locally(file_content)
             except Exception as e:
                 logger.error(f"Local PDF processing failed: {e}")
                 raise
@@ -0,0 +1,14 @@
+# app/services/registry.py
+"""
+Process-wide service instances.
+Services holding pooled HTTP clients are created once and shared by every router.
+"""
+from functools import lru_cache
+
+from app.services.transcription import TranscriptionService
+
+
+@lru_cache
+def get_transcription_service() -> TranscriptionService:
+    """Return the shared TranscriptionService (created on first use)."""
+    return TranscriptionService()
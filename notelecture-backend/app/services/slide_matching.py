@@ -1,13 +1,15 @@
 # app/services/slide_matching.py
+import asyncio
 import base64
 import httpx
-import json
+import orjson
 from typing import List, Dict, Any, Tuple, Optional
 import logging
 import time
 import traceback
 import math
 from app.core.config import settings
+from app.utils.images import to_data_url
 
 # Check if OpenCV is available
 try:
@@ -81,9 +83,15 @@ class SlideMatchingService:
                 # Read video file
                 with open(video_path_or_url, 'rb') as video_file:
                     files = {"video_file": (video_path_or_url, video_file, "video/mp4")}
+                    # Raw slide bytes are only encoded at this JSON boundary
+                    slides_payload = [
+                        {**slide, 'image_data': to_data_url(slide.get('image_mime'), slide['image_data'])}
+                        if isinstance(slide.get('image_data'), bytes) else slide
+                        for slide in slides
+                    ]
                     data = {
-                        "slides_data": json.dumps(slides),
-                        "transcription_data": json.dumps(transcription_segments)
+                        "slides_data": orjson.dumps(slides_payload).decode(),
+                        "transcription_data": orjson.dumps(transcription_segments).decode()
                     }
                     headers = {}
                     if settings.EXTERNAL_SERVICE_API_KEY:
@@ -143,43 +151,19 @@ class SlideMatchingService:
 
     async def _match_slides_local(self, video_path_or_url: str, slides: List[Dict[str, Any]], transcription_segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Local slide matching using OpenCV (original implementation)."""
-        matched_segments = []
-
         try:
-            # 1. Decode Slides
-            slide_images_decoded = []
-            for i, slide in enumerate(slides):
-                try:
-                    image_data = slide['image_data'].split(',')[-1]
-                    image_bytes = base64.b64decode(image_data)
-                    nparr = np.frombuffer(image_bytes, np.uint8)
-                    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE) # Load as grayscale
-                    if img is not None:
-                        slide_images_decoded.append({'index': slide['index'], 'image': img})
-                    else:
-                        logger.warning(f"Failed to decode slide index {slide.get('index', i)}")
-                except Exception as decode_err:
-                     logger.error(f"Error decoding slide index {slide.get('index', i)}: {decode_err}")
-
-            if not slide_images_decoded:
-                logger.error("No valid slide images could be decoded. Using simple time-based matching.")
+            # 1-3. Decode slides, compute features and scan the video off the event loop
+            loop = asyncio.get_running_loop()
+            timeline, decoded_count = await loop.run_in_executor(
+                None, self._sync_build_timeline, video_path_or_url, slides
+            )
+            if timeline is None:
                 return self._simple_time_based_matching(slides, transcription_segments)
 
-            # 2. Precompute Slide Features (ORB only)
-            logger.info("Precomputing ORB features for slides...")
-            slide_features = self._precompute_slide_features_simple(slide_images_decoded)
-            if not slide_features:
-                 logger.error("Failed to compute features for any slide. Using simple time-based matching.")
-                 return self._simple_time_based_matching(slides, transcription_segments)
-
-            # 3. Generate Timeline (Process Video or Estimate for URL)
-            logger.info("Generating match timeline by processing video...")
-            timeline = await self._process_video_best_score(video_path_or_url, slide_features)
-
             # 4. Fallback: If processing failed or resulted in only the initial point, estimate.
-            if len(timeline) <= 1 and len(slide_images_decoded) > 1:
+            if len(timeline) <= 1 and decoded_count > 1:
                  logger.warning("Video processing yielded minimal timeline. Estimating based on transcription duration.")
-                 timeline = self._estimate_timeline(transcription_segments, len(slide_images_decoded))
+                 timeline = self._estimate_timeline(transcription_segments, decoded_count)
 
             logger.info(f"FINAL Generated Timeline (Points: {len(timeline)}):")
             for i, point in enumerate(timeline):
@@ -187,12 +171,14 @@ class SlideMatchingService:
 
             # 5. Match Segments to Timeline
             logger.info("Assigning segments to slides based on timeline...")
-            segment_distribution = {}
-            for segment in transcription_segments:
-                slide_index = self._find_slide_for_timestamp(segment['start_time'], timeline)
-                matched_segments.append({**segment, 'slide_index': slide_index})
-                segment_distribution[slide_index] = segment_distribution.get(slide_index, 0) + 1
-
+            slide_indices = self._assign_segments_to_timeline(transcription_segments, timeline)
+            matched_segments = [
+                {**segment, 'slide_index': slide_index}
+                for segment, slide_index in zip(transcription_segments, slide_indices)
+            ]
+
+            distribution_keys, distribution_counts = np.unique(slide_indices, return_counts=True)
+            segment_distribution = dict(zip(distribution_keys.tolist(), distribution_counts.tolist()))
             logger.info(f"Segment distribution across slides: {segment_distribution}")
             return matched_segments
 
@@ -201,6 +187,45 @@ class SlideMatchingService:
             logger.critical("FALLBACK: Using simple time-based matching.")
             return self._simple_time_based_matching(slides, transcription_segments)
 
+    def _sync_build_timeline(self, video_path_or_url: str, slides: List[Dict[str, Any]]) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """
+        Synchronous CPU-bound part of local matching (run in an executor).
+        Returns (timeline, decoded_slide_count); timeline is None when no slide could be used.
+        """
+        # 1. Decode Slides
+        slide_images_decoded = []
+        for i, slide in enumerate(slides):
+            try:
+                image_data = slide['image_data']
+                if isinstance(image_data, bytes):
+                    image_bytes = image_data
+                else:
+                    image_bytes = base64.b64decode(image_data.split(',')[-1])
+                nparr = np.frombuffer(image_bytes, np.uint8)
+                img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE) # Load as grayscale
+                if img is not None:
+                    slide_images_decoded.append({'index': slide['index'], 'image': img})
+                else:
+                    logger.warning(f"Failed to decode slide index {slide.get('index', i)}")
+            except Exception as decode_err:
+                 logger.error(f"Error decoding slide index {slide.get('index', i)}: {decode_err}")
+
+        if not slide_images_decoded:
+            logger.error("No valid slide images could be decoded. Using simple time-based matching.")
+            return None, 0
+
+        # 2. Precompute Slide Features (ORB only)
+        logger.info("Precomputing ORB features for slides...")
+        slide_features = self._precompute_slide_features_simple(slide_images_decoded)
+        if not slide_features:
+             logger.error("Failed to compute features for any slide. Using simple time-based matching.")
+             return None, len(slide_images_decoded)
+
+        # 3. Generate Timeline (Process Video or Estimate for URL)
+        logger.info("Generating match timeline by processing video...")
+        timeline = self._process_video_best_score(video_path_or_url, slide_features)
+        return timeline, len(slide_images_decoded)
+
     def _preprocess_image(self, image) -> Any:
         """Basic preprocessing for feature detection."""
         if len(image.shape) > 2: gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -228,7 +253,7 @@ class SlideMatchingService:
                  logger.error(f"Error computing features for slide {slide_data['index']}: {e}")
         return features_list
 
-    async def _process_video_best_score(
+    def _process_video_best_score(
             self,
             video_path_or_url: str,
             slide_features: List[Dict[str, Any]]
@@ -423,12 +448,15 @@ class SlideMatchingService:
         return timeline
 
 
-    def _find_slide_for_timestamp(self, timestamp: float, timeline: List[Dict[str, Any]]) -> int:
-        """Finds the slide index active at a given timestamp based on the timeline."""
-        if not timeline: return 0
-        active_slide_index = timeline[0]['slide_index']
-        for entry in timeline:
-            if entry['time'] <= timestamp:
-                active_slide_index = entry['slide_index']
-            else: break
-        return active_slide_index
\ No newline at end of file
+    def _assign_segments_to_timeline(self, transcription_segments: List[Dict[str, Any]], timeline: List[Dict[str, Any]]) -> List[int]:
+        """Finds the slide index active at each segment's start time (vectorized binary search over the timeline)."""
+        if not transcription_segments:
+            return []
+        if not timeline:
+            return [0] * len(transcription_segments)
+        timeline_times = np.fromiter((entry['time'] for entry in timeline), dtype=np.float64, count=len(timeline))
+        timeline_slides = np.fromiter((entry['slide_index'] for entry in timeline), dtype=np.int64, count=len(timeline))
+        start_times = np.fromiter((segment['start_time'] for segment in transcription_segments), dtype=np.float64, count=len(transcription_segments))
+        # Last timeline entry with time <= start_time; timestamps before the first entry use the first slide
+        positions = np.clip(np.searchsorted(timeline_times, start_times, side='right') - 1, 0, None)
+        return timeline_slides[positions].tolist()
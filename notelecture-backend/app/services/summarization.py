@@ -1,11 +1,30 @@
 # notelecture-backend/app/services/summarization.py
+import asyncio
+import hashlib
 import logging
 import httpx
 import json
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from app.core.config import settings
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Identical prompts (same transcript, slide text and instructions) reuse the previous completion
+SUMMARY_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Batched requests: slides per API call, and the transcript + slide text budget per call
+BATCH_MAX_SLIDES = 8
+BATCH_MAX_INPUT_CHARS = 12000
+
+
+class _PendingSlide(NamedTuple):
+    index: int
+    text: str
+    slide_content: str
+    cache_key: str
+
+
 class SummarizationService:
     def __init__(self):
         self.api_key = settings.openai_api_key
@@ -13,6 +32,7 @@ class SummarizationService:
         self.temperature = 0.6
         self.max_tokens = 350
         self.base_url = "https://api.openai.com/v1/chat/completions"
+        self._summary_cache = TTLCache(maxsize=2048, ttl=SUMMARY_CACHE_TTL_SECONDS)
         
         if not self.api_key or self.api_key == "YOUR_OPENAI_API_KEY":
             logger.warning("OpenAI API Key not configured. Summarization will be skipped.")
@@ -32,11 +52,26 @@ class SummarizationService:
             logger.info("Skipping summarization for empty text.")
             return None
 
-        # Truncate text if it's extremely long
-        max_input_chars = 8000
-        if len(text) > max_input_chars:
-            logger.warning(f"Input text too long ({len(text)} chars), truncating to {max_input_chars}")
-            text = text[:max_input_chars] + "..."
+        text = self._truncate(text)
+        user_prompt = self._default_prompt(text, slide_content, max_length)
+        return await self._generate_summary(text, user_prompt)
+
+    async def summarize_with_custom_prompt(self, text: str, custom_prompt: str, slide_content: str = None) -> str | None:
+        """
+        Generates a summary for the given text using a custom user-provided prompt.
+        Returns the summary string or None if summarization fails or is skipped.
+        """
+        if not self.api_key:
+            logger.info("Skipping summarization as OpenAI API key is not configured.")
+            return None
+        if not text or text.strip() == "":
+            logger.info("Skipping summarization for empty text.")
+            return None
+        if not custom_prompt or custom_prompt.strip() == "":
+            logger.warning("Custom prompt is empty, falling back to default summarization")
+            return await self.summarize_text(text, slide_content)
+
+        text = self._truncate(text)
 
         slide_section = ""
         if slide_content and slide_content.strip():
@@ -47,8 +82,10 @@ class SummarizationService:
         ---
         """
 
+        # Sanitize and construct user prompt
+        sanitized_prompt = custom_prompt.strip()[:1000]  # Limit prompt length
         user_prompt = f"""
-        You are analyzing lecture content. Your task is to summarize the transcription text in Hebrew, focusing specifically on how it relates to and explains the slide content shown.
+        {sanitized_prompt}
         {slide_section}
         Transcription Text (what the lecturer said):
         ---
@@ -56,37 +93,127 @@ class SummarizationService:
         ---
 
         Instructions:
-        - If slide content is available, prioritize summarizing the transcription based on how it explains, elaborates on, or relates to the slide content
-        - Focus on the key explanations, examples, or details the lecturer provided about the slide topics
-        - If no slide content is available, summarize the main topics and key points from the transcription
-        - Provide a concise summary in Hebrew (2-4 bullet points or short paragraph, max {max_length} words)
-
-        Summary:
+        - Focus on how the transcription text relates to and explains the slide content (if available)
+        - Prioritize the lecturer's explanations, examples, or elaborations about the slide topics
+        - Please provide your response in Hebrew.
         """
 
         return await self._generate_summary(text, user_prompt)
 
-    async def summarize_with_custom_prompt(self, text: str, custom_prompt: str, slide_content: str = None) -> str | None:
+    async def summarize_slides_batch(
+        self, slides: Dict[int, Tuple[str, str]], max_length: int = 75
+    ) -> Dict[int, str]:
         """
-        Generates a summary for the given text using a custom user-provided prompt.
-        Returns the summary string or None if summarization fails or is skipped.
+        Summarizes several slides with as few API calls as possible.
+        slides maps slide index -> (transcription text, slide content). Returns index -> summary
+        for the slides that were summarized; slides without text or a usable answer are left out.
         """
         if not self.api_key:
             logger.info("Skipping summarization as OpenAI API key is not configured.")
-            return None
-        if not text or text.strip() == "":
-            logger.info("Skipping summarization for empty text.")
-            return None
-        if not custom_prompt or custom_prompt.strip() == "":
-            logger.warning("Custom prompt is empty, falling back to default summarization")
-            return await self.summarize_text(text, slide_content)
+            return {}
+
+        summaries: Dict[int, str] = {}
+        pending: List[_PendingSlide] = []
+        for index, (text, slide_content) in slides.items():
+            if not text or text.strip() == "":
+                continue
+            text = self._truncate(text)
+            # Same key as summarize_text, so batched and single summaries share the cache
+            cache_key = self._cache_key(self._default_prompt(text, slide_content, max_length))
+            cached = self._summary_cache.get(cache_key)
+            if cached is not None:
+                summaries[index] = cached
+            else:
+                pending.append(_PendingSlide(index, text, slide_content or "", cache_key))
+
+        groups = self._batch_groups(pending)
+        if groups:
+            logger.info(f"Summarizing {len(pending)} slides in {len(groups)} API calls ({len(summaries)} cached)")
+        for group_summaries in await asyncio.gather(*(self._summarize_group(group, max_length) for group in groups)):
+            summaries.update(group_summaries)
+        return summaries
+
+    async def _summarize_group(self, group: List[_PendingSlide], max_length: int) -> Dict[int, str]:
+        """One API call for a group of slides; the answer is a JSON object keyed by slide index."""
+        if len(group) == 1:
+            slide = group[0]
+            summary = await self._generate_summary(slide.text, self._default_prompt(slide.text, slide.slide_content, max_length))
+            return {slide.index: summary} if summary else {}
+
+        sections = "\n".join(
+            f"""
+        ---SLIDE {slide.index}---
+        Slide Content:
+        {slide.slide_content.strip() or "(no slide text)"}
+        Transcription Text (what the lecturer said):
+        {slide.text}
+        """
+            for slide in group
+        )
+        user_prompt = f"""
+        You are analyzing lecture content. For each slide below, summarize its transcription text in Hebrew, focusing specifically on how it relates to and explains that slide's content.
+        Each slide starts with a ---SLIDE <index>--- line.
+        {sections}
+
+        Instructions:
+        - Prioritize how the transcription explains, elaborates on, or relates to the slide content; if a slide has no slide text, summarize the main points of its transcription
+        - Focus on the key explanations, examples, or details the lecturer provided about the slide topics
+        - Provide a concise summary in Hebrew for every slide (2-4 bullet points or short paragraph, max {max_length} words each)
+        - Respond with a JSON object that maps each slide index (as a string) to its summary, e.g. {{"{group[0].index}": "..."}}
+        """
 
-        # Truncate text if it's extremely long
+        logger.info(f"Requesting batched summaries from OpenAI API for slides {[slide.index for slide in group]}")
+        content = await self._chat_completion(user_prompt, self.max_tokens * len(group), json_response=True)
+        if content is None:
+            return {}
+        try:
+            answer = json.loads(content)
+        except ValueError as e:
+            logger.error(f"Batched summary response was not valid JSON: {e}")
+            return {}
+        if not isinstance(answer, dict):
+            logger.error("Batched summary response was not a JSON object.")
+            return {}
+
+        summaries = {}
+        for slide in group:
+            summary = answer.get(str(slide.index))
+            if isinstance(summary, str) and summary.strip():
+                summaries[slide.index] = summary.strip()
+                self._summary_cache.set(slide.cache_key, summaries[slide.index])
+            else:
+                logger.warning(f"Batched summary response had no summary for slide {slide.index}")
+        return summaries
+
+    @staticmethod
+    def _batch_groups(pending: List[_PendingSlide]) -> List[List[_PendingSlide]]:
+        """Splits slides into groups that fit BATCH_MAX_SLIDES and BATCH_MAX_INPUT_CHARS."""
+        groups: List[List[_PendingSlide]] = []
+        current: List[_PendingSlide] = []
+        current_chars = 0
+        for slide in pending:
+            size = len(slide.text) + len(slide.slide_content)
+            if current and (len(current) >= BATCH_MAX_SLIDES or current_chars + size > BATCH_MAX_INPUT_CHARS):
+                groups.append(current)
+                current, current_chars = [], 0
+            current.append(slide)
+            current_chars += size
+        if current:
+            groups.append(current)
+        return groups
+
+    @staticmethod
+    def _truncate(text: str) -> str:
+        """Truncate text if it's extremely long."""
         max_input_chars = 8000
         if len(text) > max_input_chars:
             logger.warning(f"Input text too long ({len(text)} chars), truncating to {max_input_chars}")
             text = text[:max_input_chars] + "..."
+        return text
 
+    @staticmethod
+    def _default_prompt(text: str, slide_content: Optional[str], max_length: int) -> str:
+        """The standard summarization prompt for one slide."""
         slide_section = ""
         if slide_content and slide_content.strip():
             slide_section = f"""
@@ -96,10 +223,8 @@ class SummarizationService:
         ---
         """
 
-        # Sanitize and construct user prompt
-        sanitized_prompt = custom_prompt.strip()[:1000]  # Limit prompt length
-        user_prompt = f"""
-        {sanitized_prompt}
+        return f"""
+        You are analyzing lecture content. Your task is to summarize the transcription text in Hebrew, focusing specifically on how it relates to and explains the slide content shown.
         {slide_section}
         Transcription Text (what the lecturer said):
         ---
@@ -107,20 +232,40 @@ class SummarizationService:
         ---
 
         Instructions:
-        - Focus on how the transcription text relates to and explains the slide content (if available)
-        - Prioritize the lecturer's explanations, examples, or elaborations about the slide topics
-        - Please provide your response in Hebrew.
-        """
+        - If slide content is available, prioritize summarizing the transcription based on how it explains, elaborates on, or relates to the slide content
+        - Focus on the key explanations, examples, or details the lecturer provided about the slide topics
+        - If no slide content is available, summarize the main topics and key points from the transcription
+        - Provide a concise summary in Hebrew (2-4 bullet points or short paragraph, max {max_length} words)
 
-        return await self._generate_summary(text, user_prompt)
+        Summary:
+        """
 
     async def _generate_summary(self, text: str, user_prompt: str) -> str | None:
         """
         Private method to generate summary using the provided prompt.
         """
+        cache_key = self._cache_key(user_prompt)
+        cached = self._summary_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Summary cache hit for text snippet starting with: '{text[:100]}...'")
+            return cached
+
+        logger.info(f"Requesting summary from OpenAI API for text snippet starting with: '{text[:100]}...'")
+        content = await self._chat_completion(user_prompt, self.max_tokens)
+        if content is None:
+            return None
+        summary = content.strip().replace("Summary:", "").strip()
+        logger.info(f"Received summary: '{summary[:100]}...'")
+        if summary:
+            self._summary_cache.set(cache_key, summary)
+        return summary
+
+    async def _chat_completion(self, user_prompt: str, max_tokens: int, json_response: bool = False) -> str | None:
+        """
+        Sends one chat completion request and returns the message content,
+        or None if the request fails or the response is empty.
+        """
         try:
-            logger.info(f"Requesting summary from OpenAI API for text snippet starting with: '{text[:100]}...'")
-            
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
@@ -133,8 +278,10 @@ class SummarizationService:
                     {"role": "user", "content": user_prompt}
                 ],
                 "temperature": self.temperature,
-                "max_tokens": self.max_tokens
+                "max_tokens": max_tokens
             }
+            if json_response:
+                payload["response_format"] = {"type": "json_object"}
             
             async with httpx.AsyncClient(timeout=60.0) as client:
                 response = await client.post(self.base_url, headers=headers, json=payload)
@@ -143,10 +290,7 @@ class SummarizationService:
                 result = response.json()
                 
                 if result and "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"]
-                    summary = content.strip().replace("Summary:", "").strip()
-                    logger.info(f"Received summary: '{summary[:100]}...'")
-                    return summary
+                    return result["choices"][0]["message"]["content"]
                 else:
                     logger.warning("OpenAI API response content was empty.")
                     return None
@@ -158,5 +302,10 @@ class SummarizationService:
             logger.error(f"Error calling OpenAI API for summarization: {e}", exc_info=True)
             return None
 
+    def _cache_key(self, user_prompt: str) -> str:
+        """The prompt already embeds the transcript, OCR text and any custom instructions."""
+        key_source = f"{self.model}\x00{self.temperature}\x00{self.max_tokens}\x00{user_prompt}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
 # Instantiate the service for use in other modules
 summarization_service = SummarizationService()
\ No newline at end of file
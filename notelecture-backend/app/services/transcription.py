@@ -1,12 +1,15 @@
 # app/services/transcription.py
 import os
+import json
 import time
+import base64
 import httpx
 import asyncio
 import aiofiles
 from pathlib import Path
 from typing import List, Dict, Any
 import logging
+import subprocess
 from uuid import uuid4
 import traceback
 from app.core.config import settings
@@ -46,6 +49,9 @@ class TranscriptionService:
         # Increased timeout for potentially large file uploads/long polling
         self.http_client = httpx.AsyncClient(timeout=httpx.Timeout(180.0, connect=10.0)) # 3 minutes total, 10s connect
 
+        # Extracted audio smaller than this has no usable track and is not sent to RunPod
+        self.min_audio_bytes = 2048
+
         # How often to poll for status (in seconds)
         self.polling_interval = 5
         # Maximum polling attempts (adjust as needed) - increased for longer audio
@@ -58,7 +64,6 @@ class TranscriptionService:
             logger.info(f"[Sync] Extracting audio from '{video_path}' to '{output_audio_path}'")
 
             # Check if ffmpeg is available
-            import subprocess
             try:
                 subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
                 logger.info("[Sync] ffmpeg is available")
@@ -171,7 +176,6 @@ class TranscriptionService:
                         # Get the processed audio file from external service
                         if "audio_data" in result and result["audio_data"]:
                             # Handle base64 encoded audio data
-                            import base64
                             audio_data = base64.b64decode(result["audio_data"])
 
                             # Save to temporary file
@@ -263,7 +267,6 @@ class TranscriptionService:
         """Synchronous part of downloading and extracting audio."""
         try:
             # Check if ffmpeg is available
-            import subprocess
             try:
                 subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
                 logger.info("[Sync] ffmpeg is available for yt-dlp")
@@ -445,7 +448,6 @@ class TranscriptionService:
                     # Get the processed audio file from external service
                     if "audio_data" in result and result["audio_data"]:
                         # Handle base64 encoded audio data
-                        import base64
                         audio_data = base64.b64decode(result["audio_data"])
 
                         # Save to temporary file
@@ -501,6 +503,14 @@ class TranscriptionService:
             logger.error(f"Error calling external video service: {e}")
             raise
 
+    def has_audio(self, audio_path: str) -> bool:
+        """Cheap check run before transcription so an empty audio track never reaches RunPod."""
+        size = os.path.getsize(audio_path)
+        if size < self.min_audio_bytes:
+            logger.info(f"Audio file {audio_path} is only {size} bytes - treating as empty.")
+            return False
+        return True
+
     async def transcribe(self, audio_path: str) -> Dict[str, Any]:
         """
         Transcribe audio file using RunPod API and return detailed transcription.
@@ -530,6 +540,11 @@ class TranscriptionService:
             if not os.access(audio_path, os.R_OK):
                 raise PermissionError(f"No permission to read audio file at: {audio_path}")
 
+            if not self.has_audio(audio_path):
+                # Raised rather than returning no segments, so the lecture is marked failed
+                # instead of completing with an empty transcript
+                raise ValueError("The video has no audio track to transcribe.")
+
             # Step 1: Submit job to RunPod API (async)
             job_id = await self._submit_runpod_job(audio_path)
             logger.info(f"Job submitted successfully. RunPod Job ID: {job_id}")
@@ -675,7 +690,6 @@ class TranscriptionService:
             file_size = os.path.getsize(audio_path)
             logger.info(f"Preparing RunPod job for file: {audio_path} (Size: {file_size} bytes)")
             
-            import base64
             async with aiofiles.open(audio_path, "rb") as audio_file:
                 audio_content = await audio_file.read()
                 audio_base64 = base64.b64encode(audio_content).decode('utf-8')
@@ -780,7 +794,6 @@ class TranscriptionService:
                                 result_list = item['result']
                                 if isinstance(result_list, list):
                                     # Parse each JSON string in the result list
-                                    import json
                                     for json_str in result_list:
                                         try:
                                             segment_data = json.loads(json_str)
@@ -4,7 +4,7 @@ import uuid
 import secrets
 from typing import Generator, AsyncGenerator
 from passlib.context import CryptContext
-from app.db.connection import SessionLocal, get_async_session
+from app.db.connection import SessionLocal, get_async_read_session, get_async_session
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Password hashing context
@@ -20,19 +20,16 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_db_sync():
-    """Synchronous database session for PayPal service."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     """Async database dependency for FastAPI routes."""
     async for session in get_async_session():
         yield session
 
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Read-only (AUTOCOMMIT) async database dependency for FastAPI routes that don't write."""
+    async for session in get_async_read_session():
+        yield session
+
 
 # --- Authentication Utilities ---
 def verify_password(plain_password: str, hashed_password: str) -> bool:
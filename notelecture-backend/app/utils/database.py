@@ -1,11 +1,20 @@
 """Database utility functions."""
 
 import logging
+from typing import Any, Dict, List
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, delete, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.db.models import Lecture, TranscriptionSegment
 
 logger = logging.getLogger(__name__)
 
+# Batches at or above either limit are written with COPY instead of INSERT
+COPY_MIN_ROWS = 100
+COPY_MIN_BYTES = 1024 * 1024
+
 
 def update_lecture_status(db: Session, lecture_id: int, status: str) -> bool:
     """
@@ -20,11 +29,9 @@ def update_lecture_status(db: Session, lecture_id: int, status: str) -> bool:
         True if update was successful, False otherwise
     """
     try:
-        from app.db.models import Lecture
-        
-        lecture = db.query(Lecture).filter(Lecture.id == lecture_id).with_for_update().first()
-        if lecture:
-            lecture.status = status
+        # A single UPDATE takes the row lock itself; no need to load the lecture first
+        result = db.execute(update(Lecture).where(Lecture.id == lecture_id).values(status=status))
+        if result.rowcount:
             db.commit()
             logger.info(f"Lecture ID {lecture_id} status updated to: {status}")
             return True
@@ -40,6 +47,127 @@ def update_lecture_status(db: Session, lecture_id: int, status: str) -> bool:
         return False
 
 
+async def update_lecture_status_async(db: AsyncSession, lecture_id: int, status: str) -> bool:
+    """
+    Async variant of update_lecture_status (commits on success, rolls back on failure).
+    Any pending writes in the session are committed in the same transaction.
+    
+    Args:
+        db: Async database session
+        lecture_id: ID of the lecture to update
+        status: New status to set
+        
+    Returns:
+        True if update was successful, False otherwise
+    """
+    try:
+        result = await db.execute(update(Lecture).where(Lecture.id == lecture_id).values(status=status))
+        if result.rowcount:
+            await db.commit()
+            logger.info(f"Lecture ID {lecture_id} status updated to: {status}")
+            return True
+        else:
+            logger.warning(f"Attempted status update for non-existent lecture ID: {lecture_id}")
+            return False
+    except Exception as e:
+        logger.error(f"Failed to update status for lecture {lecture_id} to {status}: {e}", exc_info=True)
+        try:
+            await db.rollback()
+        except Exception as rb_exc:
+            logger.error(f"Rollback failed during status update failure for lecture {lecture_id}: {rb_exc}", exc_info=True)
+        return False
+
+
+def _build_segment_upsert(lecture_id: int, segments: List[Dict[str, Any]]):
+    """Builds (upsert_stmt, rows, prune_stmt) for writing a lecture's segments."""
+
+    # Deduplicate on the conflict key (a single statement cannot touch the same row twice)
+    rows_by_start: Dict[float, Dict[str, Any]] = {}
+    for seg in segments:
+        start_time = seg.get("start_time")
+        if start_time is None:
+            continue
+        rows_by_start[start_time] = {
+            "lecture_id": lecture_id,
+            "start_time": start_time,
+            "end_time": seg.get("end_time"),
+            "text": seg.get("text", ""),
+            "confidence": seg.get("confidence", 1.0),
+            "slide_index": seg.get("slide_index", 0),
+        }
+
+    prune_stmt = delete(TranscriptionSegment).where(TranscriptionSegment.lecture_id == lecture_id)
+    if not rows_by_start:
+        return None, [], prune_stmt
+
+    stmt = pg_insert(TranscriptionSegment)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["lecture_id", "start_time"],
+        set_={
+            "end_time": stmt.excluded.end_time,
+            "text": stmt.excluded.text,
+            "confidence": stmt.excluded.confidence,
+            "slide_index": stmt.excluded.slide_index,
+        },
+    )
+    prune_stmt = prune_stmt.where(TranscriptionSegment.start_time.notin_(list(rows_by_start)))
+    return stmt, list(rows_by_start.values()), prune_stmt
+
+
+async def upsert_transcription_segments_async(db: AsyncSession, lecture_id: int, segments: List[Dict[str, Any]]) -> int:
+    """
+    Write a lecture's transcription segments with INSERT ... ON CONFLICT DO UPDATE.
+    Rows are keyed on (lecture_id, start_time); segments from a previous run that
+    are not part of the new set are removed. Does not commit.
+
+    Args:
+        db: Async database session
+        lecture_id: ID of the lecture the segments belong to
+        segments: Segment dicts with start_time, end_time, text, confidence, slide_index
+
+    Returns:
+        Number of segments written
+    """
+    upsert_stmt, rows, prune_stmt = _build_segment_upsert(lecture_id, segments)
+    if upsert_stmt is not None:
+        await db.execute(upsert_stmt, rows)
+    await db.execute(prune_stmt)
+    return len(rows)
+
+
+async def bulk_insert_rows_async(db: AsyncSession, model: Any, rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert row dicts for an ORM model. Large batches on asyncpg use binary COPY
+    (copy_records_to_table) inside the session's transaction; anything else is a
+    single multi-row INSERT. Does not commit.
+    """
+    if not rows:
+        return 0
+
+    columns = list(rows[0].keys())
+    payload_bytes = sum(len(value) for row in rows for value in row.values() if isinstance(value, (str, bytes)))
+    use_copy = (
+        db.get_bind().dialect.driver == "asyncpg"
+        and (len(rows) >= COPY_MIN_ROWS or payload_bytes >= COPY_MIN_BYTES)
+    )
+    if use_copy:
+        logger.info(f"Copying {len(rows)} rows into {model.__tablename__} ({payload_bytes} bytes)")
+        connection = await db.connection()
+        # The asyncpg adapter only sends BEGIN on its first execute, and COPY on the driver
+        # connection bypasses it; without this the COPY would autocommit on its own
+        await connection.execute(text("SELECT 1"))
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            model.__tablename__,
+            records=[tuple(row.get(col) for col in columns) for row in rows],
+            columns=columns,
+        )
+        return len(rows)
+
+    await db.execute(insert(model), rows)
+    return len(rows)
+
+
 def check_column_exists(db: Session, table_name: str, column_name: str) -> bool:
     """
     Check if a column exists in a table.
@@ -0,0 +1,26 @@
+"""Helpers for converting slide images between raw bytes and data URLs."""
+
+import base64
+from typing import Optional, Tuple
+
+DEFAULT_IMAGE_MIME = "image/png"
+
+
+def split_data_url(data_url: str) -> Tuple[str, bytes]:
+    """
+    Split a "data:<mime>;base64,<payload>" URL into its MIME type and raw bytes.
+    A bare base64 string (no data URL prefix) is treated as PNG.
+    """
+    if data_url.startswith("data:"):
+        header, _, payload = data_url.partition(",")
+        mime = header[5:].split(";", 1)[0] or DEFAULT_IMAGE_MIME
+    else:
+        mime, payload = DEFAULT_IMAGE_MIME, data_url
+    return mime, base64.b64decode(payload)
+
+
+def to_data_url(mime: Optional[str], image_bytes: Optional[bytes]) -> Optional[str]:
+    """Encode raw image bytes as a data URL (used only at the JSON boundary)."""
+    if image_bytes is None:
+        return None
+    return f"data:{mime or DEFAULT_IMAGE_MIME};base64,{base64.b64encode(image_bytes).decode('ascii')}"
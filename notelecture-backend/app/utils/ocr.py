@@ -1,7 +1,23 @@
+import os
+import queue
+import importlib.util
 import base64
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
-from PIL import Image
+from typing import Optional
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+# Prefer tesserocr (in-process, model loaded once) over pytesseract (one tesseract process per call).
+# tesserocr is only looked up here and imported on first use (_load_tesserocr): libtesseract reads
+# OMP_THREAD_LIMIT when it loads, and OCR workers set that first in _init_ocr_worker
+TESSEROCR_AVAILABLE = importlib.util.find_spec("tesserocr") is not None
+tesserocr = None
 
 try:
     import pytesseract
@@ -9,10 +25,112 @@ try:
 except ImportError:
     PYTESSERACT_AVAILABLE = False
     pytesseract = None
-    logging.warning("pytesseract not available - OCR functionality disabled")
+
+OCR_AVAILABLE = TESSEROCR_AVAILABLE or PYTESSERACT_AVAILABLE
+if not OCR_AVAILABLE:
+    logging.warning("Neither tesserocr nor pytesseract available - OCR functionality disabled")
 
 logger = logging.getLogger(__name__)
 
+# Use Hebrew and English languages for better accuracy
+OCR_LANGUAGES = "heb+eng"
+
+# Slides wider/taller than this are downscaled before OCR (~300 DPI for a full-page slide)
+OCR_MAX_DIMENSION = 2000
+
+# Worker processes that run OCR off the API process (see extract_text_from_image_bytes_async)
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+
+# Initialized tesserocr APIs, reused across calls. PyTessBaseAPI isn't thread-safe, so each
+# call borrows one exclusively; at most one is created per concurrent caller.
+_tesseract_apis: "queue.SimpleQueue" = queue.SimpleQueue()
+
+
+def _load_tesserocr():
+    global tesserocr
+    if tesserocr is None:
+        import tesserocr as tesserocr_module
+        tesserocr = tesserocr_module
+    return tesserocr
+
+
+@contextmanager
+def _borrow_tesseract_api():
+    try:
+        api = _tesseract_apis.get_nowait()
+    except queue.Empty:
+        api = _load_tesserocr().PyTessBaseAPI(lang=OCR_LANGUAGES)
+    try:
+        yield api
+    finally:
+        _tesseract_apis.put(api)
+
+
+def _init_ocr_worker() -> None:
+    """Loads the tesseract model when an OCR worker starts, not on its first slide."""
+    # The pool already runs OCR in parallel, so keep each worker's tesseract single-threaded to
+    # avoid oversubscribing the CPU. Set only in the worker (before tesseract loads, and inherited
+    # by pytesseract's tesseract processes); the API process and its ffmpeg/render subprocesses
+    # keep their environment.
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    if TESSEROCR_AVAILABLE:
+        _tesseract_apis.put(_load_tesserocr().PyTessBaseAPI(lang=OCR_LANGUAGES))
+
+
+def _ocr_worker_count() -> int:
+    return settings.OCR_WORKERS or min(4, os.cpu_count() or 1)
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    if _ocr_pool is None:
+        workers = _ocr_worker_count()
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+        )
+        logger.info(f"Started OCR pool with {workers} worker(s)")
+    return _ocr_pool
+
+
+def shutdown_ocr_pool() -> None:
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def _otsu_threshold(histogram: list) -> int:
+    """Returns the grey level that best separates a 256-bin histogram into two classes."""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background_count = background_sum = 0
+    best_level, best_variance = 128, 0.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_sum += level * count
+        mean_diff = background_sum / background_count - (weighted_total - background_sum) / foreground_count
+        variance = background_count * foreground_count * mean_diff * mean_diff
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def _prepare_for_ocr(image: Image.Image) -> Image.Image:
+    """Downscales and binarizes a slide so tesseract has fewer pixels to process."""
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+    image = ImageOps.autocontrast(image.convert('L'))
+    threshold = _otsu_threshold(image.histogram())
+    return image.point(lambda p: 255 if p > threshold else 0, '1')
+
+
 def extract_text_from_base64_image(base64_image_data: str) -> str:
     """
     Extracts text from a base64-encoded image using OCR.
@@ -23,10 +141,6 @@ def extract_text_from_base64_image(base64_image_data: str) -> str:
     Returns:
         Extracted text or empty string if OCR fails
     """
-    if not PYTESSERACT_AVAILABLE:
-        logger.warning("pytesseract not available - returning empty string")
-        return ""
-        
     try:
         # Remove data URL prefix if present (e.g., "data:image/png;base64,")
         if base64_image_data.startswith('data:'):
@@ -34,17 +148,41 @@ def extract_text_from_base64_image(base64_image_data: str) -> str:
         
         # Decode base64 to bytes
         image_bytes = base64.b64decode(base64_image_data)
+    except Exception as e:
+        logger.warning(f"OCR text extraction failed: {e}")
+        return ""
+
+    return extract_text_from_image_bytes(image_bytes)
+
+
+def extract_text_from_image_bytes(image_bytes: bytes) -> str:
+    """
+    Extracts text from raw image bytes (PNG, WebP, ...) using OCR.
+    
+    Args:
+        image_bytes: Encoded image file contents
+    
+    Returns:
+        Extracted text or empty string if OCR fails
+    """
+    if not OCR_AVAILABLE:
+        logger.warning("OCR not available - returning empty string")
+        return ""
         
+    try:
         # Open image with PIL
         image = Image.open(BytesIO(image_bytes))
         
-        # Convert to RGB if necessary (OCR works better with RGB)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # Downscale and binarize (grayscale + Otsu threshold) before recognition
+        image = _prepare_for_ocr(image)
         
         # Extract text using tesseract
-        # Use Hebrew and English languages for better accuracy
-        extracted_text = pytesseract.image_to_string(image, lang='heb+eng')
+        if TESSEROCR_AVAILABLE:
+            with _borrow_tesseract_api() as api:
+                api.SetImage(image)
+                extracted_text = api.GetUTF8Text()
+        else:
+            extracted_text = pytesseract.image_to_string(image, lang=OCR_LANGUAGES)
         
         # Clean up the text
         cleaned_text = extracted_text.strip().replace('\n\n', '\n')
@@ -54,4 +192,12 @@ def extract_text_from_base64_image(base64_image_data: str) -> str:
         
     except Exception as e:
         logger.warning(f"OCR text extraction failed: {e}")
-        return ""
\ No newline at end of file
+        return ""
+
+
+async def extract_text_from_image_bytes_async(image_bytes: bytes) -> str:
+    """Runs extract_text_from_image_bytes in the OCR worker pool; calls beyond its size queue."""
+    if not OCR_AVAILABLE:
+        return ""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_ocr_pool(), extract_text_from_image_bytes, image_bytes)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Migration script to add composite indexes for the hot lecture queries:
+- lectures (user_id, id DESC) for the per-user lecture list
+- slides (lecture_id, index) for loading a lecture's slides in order
+Segments already have (lecture_id, start_time) via uq_transcription_segments_lecture_start.
+Indexes are built CONCURRENTLY so the tables stay writable.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+INDEXES = [
+    ("ix_lectures_user_id_id", "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lectures_user_id_id ON lectures (user_id, id DESC)"),
+    ("ix_slides_lecture_id_index", "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_slides_lecture_id_index ON slides (lecture_id, index)"),
+]
+
+def run_migration():
+    """Create the composite indexes if they don't exist."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name, ddl in INDEXES:
+                conn.execute(text(ddl))
+                print(f"Index {name} is in place")
+
+        print("✅ Lecture lookup index migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
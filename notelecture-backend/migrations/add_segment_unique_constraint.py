@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the (lecture_id, start_time) unique constraint on transcription_segments.
+The constraint is the conflict target used when segments are upserted.
+Duplicate rows left by earlier runs are removed first (the newest row is kept).
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+def run_migration():
+    """Deduplicate segments and add the unique constraint if it doesn't exist."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        with engine.begin() as conn:
+            exists = conn.execute(text("""
+                SELECT 1 FROM pg_constraint
+                WHERE conname = 'uq_transcription_segments_lecture_start'
+            """)).scalar()
+
+            if exists:
+                print("✅ Constraint uq_transcription_segments_lecture_start already exists, nothing to do.")
+                return
+
+            removed = conn.execute(text("""
+                DELETE FROM transcription_segments a
+                USING transcription_segments b
+                WHERE a.lecture_id = b.lecture_id
+                  AND a.start_time = b.start_time
+                  AND a.id < b.id
+            """)).rowcount
+            print(f"Removed {removed} duplicate segment rows")
+
+            conn.execute(text("""
+                ALTER TABLE transcription_segments
+                ADD CONSTRAINT uq_transcription_segments_lecture_start
+                UNIQUE (lecture_id, start_time)
+            """))
+
+        print("✅ Segment unique constraint migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Migration script to add slides.ocr_text, which caches the OCR of each slide image
+so summarize requests don't re-run Tesseract on the same slide.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+def run_migration():
+    """Add the ocr_text column if it doesn't exist."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE slides ADD COLUMN IF NOT EXISTS ocr_text TEXT NULL"))
+
+        print("✅ Slide OCR text migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration script to add users.total_lectures_ever and backfill it from the lectures table.
+The counter is kept up to date when lectures are created and deleted, so the usage
+endpoint no longer has to COUNT a user's lectures on every request.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+def run_migration():
+    """Add the counter column if needed and backfill it."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        with engine.begin() as conn:
+            conn.execute(text("""
+                ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS total_lectures_ever INTEGER NOT NULL DEFAULT 0
+            """))
+
+            updated = conn.execute(text("""
+                UPDATE users u
+                SET total_lectures_ever = counts.lecture_count
+                FROM (
+                    SELECT user_id, COUNT(*) AS lecture_count
+                    FROM lectures
+                    GROUP BY user_id
+                ) counts
+                WHERE counts.user_id = u.id
+            """)).rowcount
+            print(f"Backfilled lecture counts for {updated} users")
+
+        print("✅ User lecture counter migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the partial index used by the active-subscription lookup:
+user_subscriptions (user_id, end_date) WHERE is_active = true.
+The index is built CONCURRENTLY so the table stays writable.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+def run_migration():
+    """Create the partial index if it doesn't exist."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_sub_active
+                ON user_subscriptions (user_id, end_date)
+                WHERE is_active = true
+            """))
+
+        print("✅ Active subscription index migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Migration script to store slide images as raw bytes instead of base64 text.
+Adds slides.image_mime (taken from the existing data URL prefix) and converts
+slides.image_data from TEXT (base64 data URL) to BYTEA.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from app.core.config import settings
+
+def run_migration():
+    """Convert slides.image_data to bytea if it is still text."""
+    try:
+        engine = create_engine(settings.DATABASE_URL.replace('+asyncpg', ''))
+
+        with engine.begin() as conn:
+            data_type = conn.execute(text("""
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'slides' AND column_name = 'image_data'
+            """)).scalar()
+
+            if data_type == 'bytea':
+                print("✅ slides.image_data is already bytea, nothing to do.")
+                return
+
+            conn.execute(text("ALTER TABLE slides ADD COLUMN IF NOT EXISTS image_mime VARCHAR(32)"))
+            conn.execute(text("""
+                UPDATE slides
+                SET image_mime = COALESCE(substring(image_data from '^data:([^;,]+)'), 'image/png')
+                WHERE image_data IS NOT NULL
+            """))
+            conn.execute(text("""
+                ALTER TABLE slides
+                ALTER COLUMN image_data TYPE BYTEA
+                USING decode(
+                    CASE WHEN position(',' in image_data) > 0
+                         THEN split_part(image_data, ',', 2)
+                         ELSE image_data END,
+                    'base64'
+                )
+            """))
+
+        print("✅ Slide image migration completed successfully!")
+        print("- slides.image_data converted to BYTEA")
+        print("- slides.image_mime added")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()